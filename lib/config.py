@@ -11,6 +11,9 @@ WIFI_CONFIG = {
     'password': '',                  # Captive portal password (empty = open)
     'authmode': 0,                   # 0=open, 1=WEP, 2=WPA-PSK, 3=WPA2-PSK, 4=WPA/WPA2-PSK
     'profiles_file': 'wifi.dat',    # File storing known WiFi networks
+    'disable_power_save': True,     # Turn off modem sleep while awake (lower request latency)
+    'weak_signal_rssi': -75,        # Below this RSSI (dBm), raise TX power
+    'max_txpower_dbm': 20,          # TX power used on a weak signal
 }
 
 WIFI_TIMEOUT_CONFIG = {
@@ -28,13 +31,16 @@ CAMERA_CONFIG = {
     'camera_id': 0,                 # Camera ID (usually 0 for ESP32)
     'format': 'JPEG',               # Image format (JPEG recommended)
     'fb_location': 'PSRAM',         # Frame buffer location (PSRAM or DRAM)
+    'fb_count': 1,                  # Frame buffers; one is enough for single shots
     'contrast': 1,                  # Camera contrast (-2 to 2)
     'saturation': -1,               # Camera saturation (-2 to 2)
-    'framesize': 'QXGA',            # Frame size (OV2640: QXGA is 2048x1536)
+    'framesize': 'QXGA',            # Frame size (OV2640: QXGA is 2048x1536); server may override
+    'jpeg_quality': 10,             # JPEG quality 10-63 (lower = better, larger files)
 }
 
 CAMERA_TIMING = {
-    'stabilize_delay_s': 1.2,       # Time to wait for camera to stabilize after init
+    'stabilize_delay_s': 1.2,       # Max time to wait for camera to stabilize after init
+    'converge_tolerance': 0.01,     # Exposure settled once warm-up frame sizes differ by less than this
     'capture_timeout_s': 10,        # Max time to wait for capture
 }
 
@@ -55,6 +61,12 @@ NETWORK_CONFIG = {
     'max_retries': 3,               # Maximum number of retries (not currently used)
 }
 
+NTP_CONFIG = {
+    'resync_interval_s': 60 * 60,   # Skip NTP if synced within this time (RTC drift stays small)
+    'attempts': 3,                  # NTP attempts per sync
+    'retry_delay_ms': 500,          # Delay before the first retry, doubled each time
+}
+
 # ============================================================================
 # WAKEUP TIMING CONFIGURATION
 # ============================================================================
@@ -67,6 +79,11 @@ WAKEUP_CONFIG = {
     'esp32_epoch_offset': 946684800,             # ESP32 epoch: Jan 1, 2000 (seconds from esp32 epoch)
 }
 
+CONFIG_CACHE = {
+    'enabled': True,                # Cache the server config in RTC memory across deep sleep
+    'max_bytes': 2048,              # RTC user memory available on ESP32
+}
+
 # ============================================================================
 # SLEEP CONFIGURATION (Power management)
 # ============================================================================
@@ -83,12 +100,17 @@ STATE_CONFIG = {
     'state_file': 'device_state.json',  # File to store device state
     'log_file': 'device.log',           # Optional: device log file
     'max_log_entries': 100,             # Max entries in circular log
+    'flush_interval_ms': 5000,          # Min time between state writes to flash
+    'events_file': 'device_events.log', # Append-only event log (one JSON event per line)
+    'max_events': 50,                   # Events kept when the event log is rotated
+    'max_events_bytes': 4096,           # Rotate the event log beyond this size
 }
 
 LOG_CONFIG = {
     'level': 'INFO',                    # Log level: DEBUG, INFO, WARN, ERROR
     'format': 'simple',                 # Log format: simple or detailed
     'file_enabled': False,              # Enable file logging (uses more storage)
+    'file_flush_lines': 32,             # Flush the log file every N lines
 }
 
 # ============================================================================
@@ -131,31 +153,40 @@ TEST_MODE = False
 # CONFIGURATION BUILDER
 # ============================================================================
 
+_CONFIG = None
+
+
 def get_config():
     """
     Get the complete configuration dictionary.
     
     This function merges all configuration sections into a single
-    dictionary for easy access throughout the application.
+    dictionary for easy access throughout the application. The dict is
+    built once and shared between callers, so treat it as read-only.
     
     Returns:
         dict: Complete configuration
     """
-    return {
-        'wifi': WIFI_CONFIG,
-        'wifi_timeout': WIFI_TIMEOUT_CONFIG,
-        'camera': CAMERA_CONFIG,
-        'camera_timing': CAMERA_TIMING,
-        'camera_white_balance': CAMERA_WHITE_BALANCE,
-        'network': NETWORK_CONFIG,
-        'wakeup': WAKEUP_CONFIG,
-        'sleep': SLEEP_CONFIG,
-        'state': STATE_CONFIG,
-        'log': LOG_CONFIG,
-        'firmware': FIRMWARE_CONFIG,
-        'test_mode': TEST_MODE_CONFIG,
-        'test_mode_enabled': TEST_MODE,
-    }
+    global _CONFIG
+    if _CONFIG is None:
+        _CONFIG = {
+            'wifi': WIFI_CONFIG,
+            'wifi_timeout': WIFI_TIMEOUT_CONFIG,
+            'camera': CAMERA_CONFIG,
+            'camera_timing': CAMERA_TIMING,
+            'camera_white_balance': CAMERA_WHITE_BALANCE,
+            'network': NETWORK_CONFIG,
+            'ntp': NTP_CONFIG,
+            'wakeup': WAKEUP_CONFIG,
+            'config_cache': CONFIG_CACHE,
+            'sleep': SLEEP_CONFIG,
+            'state': STATE_CONFIG,
+            'log': LOG_CONFIG,
+            'firmware': FIRMWARE_CONFIG,
+            'test_mode': TEST_MODE_CONFIG,
+            'test_mode_enabled': TEST_MODE,
+        }
+    return _CONFIG
 
 
 def validate_config():
@@ -200,9 +231,11 @@ def validate_config():
 # INITIALIZATION
 # ============================================================================
 
-# Validate config on module load
-try:
-    validate_config()
-except ValueError as e:
-    print(f"ERROR: Invalid configuration: {e}")
-    raise
+# Validate config on module load. Skipped when built with optimisation
+# enabled (micropython.opt_level() >= 1 / mpy-cross -O), where __debug__ is False.
+if __debug__:
+    try:
+        validate_config()
+    except ValueError as e:
+        print(f"ERROR: Invalid configuration: {e}")
+        raise
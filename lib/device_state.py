@@ -6,9 +6,17 @@ allowing the device to maintain history and status information.
 """
 
 import json
+import os
 import time
 from lib.config import STATE_CONFIG
 
+# The first json call is much slower than later ones; pay that cost at
+# import time rather than on the boot-time state load.
+json.dumps(None)
+
+# Bump when fields are added to or removed from the persisted state
+STATE_SCHEMA_VERSION = 2
+
 
 class DeviceState:
     """
@@ -20,6 +28,9 @@ class DeviceState:
     - Error history
     - WiFi connection statistics
     - Camera capture statistics
+    
+    Counters live in a small JSON state file; events are appended to a
+    separate line-delimited log so recording one doesn't rewrite the rest.
     """
     
     def __init__(self, state_file=None):
@@ -30,11 +41,33 @@ class DeviceState:
             state_file (str): Path to state file (default: from config)
         """
         self.state_file = state_file or STATE_CONFIG.get('state_file', 'device_state.json')
-        self.state = self._load_state()
-        self._init_defaults()
+        self.flush_interval_ms = STATE_CONFIG.get('flush_interval_ms', 5000)
+        self.events_file = STATE_CONFIG.get('events_file', 'device_events.log')
+        self.max_events = STATE_CONFIG.get('max_events', 50)
+        self.max_events_bytes = STATE_CONFIG.get('max_events_bytes', 4096)
+        self._state = None  # Loaded from flash on first access
+        self._status_cache = None
+        self._dirty = False
+        self._last_flush_ms = time.ticks_ms()
+    
+    @property
+    def state(self):
+        """Persisted state dict, read from the state file on first access."""
+        if self._state is None:
+            self._state = self._load_state()
+            self._init_defaults()
+        return self._state
+    
+    @state.setter
+    def state(self, value):
+        self._state = value
+        self._status_cache = None
     
     def _init_defaults(self):
         """Ensure all required state fields exist."""
+        if self.state.get('_v') == STATE_SCHEMA_VERSION:
+            return
+        
         defaults = {
             'boot_count': 0,
             'first_boot_time': None,
@@ -48,13 +81,16 @@ class DeviceState:
             'camera_failures': 0,
             'successful_uploads': 0,
             'failed_uploads': 0,
-            'events': [],  # List of [timestamp, event_type, message]
         }
         
         # Add missing fields
         for key, default_value in defaults.items():
             if key not in self.state:
                 self.state[key] = default_value
+        
+        # Events used to be stored inline; they now live in the event log
+        self.state.pop('events', None)
+        self.state['_v'] = STATE_SCHEMA_VERSION
     
     def _load_state(self):
         """Load state from file."""
@@ -67,46 +103,86 @@ class DeviceState:
             return {}
     
     def _save_state(self):
-        """Save state to file."""
+        """
+        Save state to file.
+        
+        Writes to a temporary file and renames it over the state file, so a
+        power cut mid-write leaves the previous state intact.
+        """
+        tmp_file = self.state_file + '.tmp'
         try:
-            with open(self.state_file, 'w') as f:
+            with open(tmp_file, 'w') as f:
                 json.dump(self.state, f)
+            os.rename(tmp_file, self.state_file)
         except Exception as e:
             print(f"ERROR: Failed to save device state: {e}")
     
+    def _mark_dirty(self):
+        """Mark state as changed and flush if the debounce interval has elapsed."""
+        self._dirty = True
+        self._status_cache = None
+        self.flush()
+    
+    def flush(self, force=False):
+        """
+        Write pending state changes to flash.
+        
+        State changes are buffered in memory and written at most once per
+        flush interval, so a wake cycle costs one or two flash writes
+        rather than one per event.
+        
+        Args:
+            force (bool): Write immediately, ignoring the flush interval
+        
+        Returns:
+            bool: True if state was written
+        """
+        if not self._dirty or self._state is None:
+            return False
+        
+        now = time.ticks_ms()
+        if not force and time.ticks_diff(now, self._last_flush_ms) < self.flush_interval_ms:
+            return False
+        
+        self._save_state()
+        self._dirty = False
+        self._last_flush_ms = now
+        return True
+    
     def record_boot(self):
         """Record a device boot event."""
         current_time = time.time()
-        self.state['last_boot_time'] = current_time
+        state = self.state
+        state['last_boot_time'] = current_time
         
-        if self.state['first_boot_time'] is None:
-            self.state['first_boot_time'] = current_time
+        if state['first_boot_time'] is None:
+            state['first_boot_time'] = current_time
         
-        self.state['boot_count'] = self.state.get('boot_count', 0) + 1
-        self._record_event('boot', f"Device booted (count: {self.state['boot_count']})")
-        self._save_state()
+        state['boot_count'] += 1
+        self._record_event('boot', f"Device booted (count: {state['boot_count']})")
+        self._mark_dirty()
     
     def record_wifi_failure(self):
         """Record a WiFi connection failure."""
-        self.state['wifi_failures'] = self.state.get('wifi_failures', 0) + 1
+        self.state['wifi_failures'] += 1
         self._record_event('wifi_failure', 'Failed to connect to WiFi')
-        self._save_state()
+        self._mark_dirty()
     
     def record_wifi_success(self):
         """Record successful WiFi connection."""
         self._record_event('wifi_success', 'Connected to WiFi')
-        self._save_state()
+        self._mark_dirty()
     
     def record_camera_failure(self):
         """Record a camera capture failure."""
-        self.state['camera_failures'] = self.state.get('camera_failures', 0) + 1
+        self.state['camera_failures'] += 1
         self._record_event('camera_failure', 'Failed to capture image')
-        self._save_state()
+        self._mark_dirty()
     
     def record_camera_success(self, frame_size_bytes):
         """Record successful camera capture."""
         self._record_event('camera_success', f'Captured {frame_size_bytes} bytes')
-        self._save_state()
+        self._mark_dirty()
     
     def record_upload_attempt(self, success, error_msg=None):
         """
@@ -117,18 +193,19 @@ class DeviceState:
             error_msg (str): Error message if failed
         """
         current_time = time.time()
-        self.state['last_upload_time'] = current_time
-        self.state['last_upload_success'] = success
+        state = self.state
+        state['last_upload_time'] = current_time
+        state['last_upload_success'] = success
         
         if success:
-            self.state['successful_uploads'] = self.state.get('successful_uploads', 0) + 1
+            state['successful_uploads'] += 1
             self._record_event('upload_success', 'Image uploaded successfully')
         else:
-            self.state['failed_uploads'] = self.state.get('failed_uploads', 0) + 1
+            state['failed_uploads'] += 1
             self.record_error(error_msg or 'Upload failed')
             self._record_event('upload_failure', error_msg or 'Upload failed')
         
-        self._save_state()
+        self._mark_dirty()
     
     def record_error(self, error_msg, error_type='general'):
         """
@@ -139,15 +216,16 @@ class DeviceState:
             error_type (str): Type of error (wifi, camera, network, etc)
         """
         current_time = time.time()
-        self.state['error_count'] = self.state.get('error_count', 0) + 1
-        self.state['last_error'] = error_msg
-        self.state['last_error_time'] = current_time
+        state = self.state
+        state['error_count'] += 1
+        state['last_error'] = error_msg
+        state['last_error_time'] = current_time
         self._record_event(f'error_{error_type}', error_msg)
-        self._save_state()
+        self._mark_dirty()
     
     def _record_event(self, event_type, message):
         """
-        Record an event in the event log.
+        Append an event to the event log file.
         
         Args:
             event_type (str): Type of event
@@ -156,30 +234,67 @@ class DeviceState:
         current_time = time.time()
         event = [current_time, event_type, message]
         
-        if 'events' not in self.state:
-            self.state['events'] = []
-        
-        self.state['events'].append(event)
-        
-        # Keep only recent events (last 50)
-        max_events = 50
-        if len(self.state['events']) > max_events:
-            self.state['events'] = self.state['events'][-max_events:]
+        try:
+            with open(self.events_file, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+            
+            # Keep only recent events once the log grows too large
+            if os.stat(self.events_file)[6] > self.max_events_bytes:
+                self._rotate_events()
+        except Exception as e:
+            print(f"ERROR: Failed to write event log: {e}")
+    
+    def _read_events(self):
+        """Read all events from the event log file."""
+        events = []
+        try:
+            with open(self.events_file, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except OSError:
+            pass
+        return events
+    
+    def _rotate_events(self):
+        """Truncate the event log to the most recent entries."""
+        events = self._read_events()
+        if len(events) > self.max_events:
+            del events[:len(events) - self.max_events]
+        with open(self.events_file, 'w') as f:
+            for event in events:
+                f.write(json.dumps(event) + '\n')
     
     def get_status(self):
         """
         Get comprehensive device status.
         
+        The dict is cached until the next state change; only the uptime is
+        recomputed on each call.
+        
         Returns:
             dict: Device status information
         """
+        status = self._status_cache
+        if status is None:
+            status = self._status_cache = self._build_status()
+        
         uptime_s = None
         if self.state['last_boot_time']:
             uptime_s = time.time() - self.state['last_boot_time']
-        
+        status['uptime_seconds'] = uptime_s
+        return status
+    
+    def _build_status(self):
+        """Build the status dict from current state (without uptime)."""
         return {
             'boot_count': self.state.get('boot_count', 0),
-            'uptime_seconds': uptime_s,
+            'uptime_seconds': None,
             'last_upload_success': self.state.get('last_upload_success'),
             'successful_uploads': self.state.get('successful_uploads', 0),
             'failed_uploads': self.state.get('failed_uploads', 0),
@@ -203,7 +318,7 @@ class DeviceState:
         Returns:
             list: List of [timestamp, event_type, message] events
         """
-        events = self.state.get('events', [])
+        events = self._read_events()
         if count > 0:
             return events[-count:]
         return events
@@ -222,7 +337,7 @@ class DeviceState:
         Returns:
             list: List of error events
         """
-        events = self.state.get('events', [])
+        events = self._read_events()
         errors = [e for e in events if 'error' in e[1]]
         if count > 0:
             return errors[-count:]
@@ -231,22 +346,30 @@ class DeviceState:
     def reset_error_count(self):
         """Reset error counter."""
         self.state['error_count'] = 0
-        self._save_state()
+        self._mark_dirty()
     
     def reset_all(self):
         """Reset all state (careful!)."""
         self.state = {}
         self._init_defaults()
-        self._save_state()
+        self._dirty = True
+        self.flush(force=True)
+        try:
+            os.remove(self.events_file)
+        except OSError:
+            pass
     
     def export_state(self):
         """
         Export complete state for debugging.
         
         Returns:
-            dict: Complete state
+            dict: Complete state, including the event log
         """
-        return json.loads(json.dumps(self.state))
+        # State values are all scalars, so a shallow copy is independent
+        state = dict(self.state)
+        state['events'] = self._read_events()
+        return state
 
 
 # Global device state instance
@@ -1,15 +1,23 @@
 """
     IoT Manager MicroPython Client.
 """
+import errno
 import gc
 import uos
-import urequests as requests
+import usocket as socket
+import ussl as ssl
 import ujson as json
-import ubinascii as binascii
 import deflate
 import lib.utarfile as tarfile
 import time
 import machine
+import micropython
+
+# Print per-request and per-file progress (slows transfers over serial)
+DEBUG = False
+
+# Warm up json so the first server response isn't parsed on the cold path
+json.dumps(None)
 
 
 class IotManagerError(Exception):
@@ -25,12 +33,26 @@ class EndpointNotFoundError(IotManagerError):
 
 
 class ServerError(IotManagerError):
-    pass
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Endpoint descriptions advertised by the server -> client method names
+_DESC_TO_METHOD = {
+    'GetLatestVersion': 'get_latest_version',
+    'CreateDeviceStatus': 'create_device_status',
+    'CreateContent': 'create_content',
+    'Authenticate': 'authenticate',
+    'GetConfig': 'get_config',
+}
+_METHOD_TO_DESC = {v: k for k, v in _DESC_TO_METHOD.items()}
 
 
 def _join_url(base_url, path):
     base = base_url.rstrip('/')
-    url_without_path = "/".join(base.split("/")[:-1])
+    i = base.rfind('/')
+    url_without_path = base[:i] if i >= 0 else ''
     if not path:
         return url_without_path
     if path.startswith('/'):
@@ -38,95 +60,407 @@ def _join_url(base_url, path):
     return url_without_path + '/' + path
 
 
+# Characters that would change the meaning of a query string; '%' first
+_QS_ESCAPES = (('%', '%25'), ('&', '%26'), ('=', '%3D'), ('+', '%2B'), ('#', '%23'), (' ', '%20'))
+
+
+def _qs_escape(value):
+    if not isinstance(value, str):
+        value = str(value)
+    for ch, esc in _QS_ESCAPES:
+        if ch in value:
+            value = value.replace(ch, esc)
+    return value
+
+
+@micropython.native
 def _encode_qs(params):
     if not params:
         return ''
-    parts = []
-    for k, v in params.items():
-        if v is None:
-            continue
-        parts.append("%s=%s" % (str(k), str(v)))
-    return '&'.join(parts)
+    return '&'.join(_qs_escape(k) + '=' + _qs_escape(v) for k, v in params.items() if v is not None)
+
+
+_boundary_counter = 0
 
 
 def _generate_boundary():
-    """Generate a boundary string for multipart form data."""
-    try:
-        import os
-        random_bytes = os.urandom(8)
-    except (ImportError, NotImplementedError):
-        # Fallback for systems without os.urandom
-        import time
-        random_bytes = str(int(time.time() * 1000000))[-8:].encode()
+    """Generate a boundary string for multipart form data.
     
-    return 'boundary' + binascii.hexlify(random_bytes).decode()
+    The boundary only has to be unique per request and unlikely to occur
+    in the body, so a tick count plus a counter is enough; no RNG needed.
+    """
+    global _boundary_counter
+    _boundary_counter += 1
+    return 'boundary%06x%x' % (time.ticks_ms() & 0xffffff, _boundary_counter)
+
+
+# Read size used when streaming file content from flash
+_UPLOAD_CHUNK_SIZE = 4096
+
+# Buffer size used when extracting OTA archive members to flash
+_OTA_CHUNK_SIZE = 4096
+
+
+def _content_length(content):
+    """Return the size in bytes of file content (bytes, path or file object)."""
+    if isinstance(content, str):
+        return uos.stat(content)[6]
+    if hasattr(content, 'read'):
+        pos = content.tell()
+        size = content.seek(0, 2)
+        content.seek(pos)
+        return size - pos
+    return len(content)
 
 
+def _iter_parts(parts):
+    """Yield body chunks, reading file paths and file objects incrementally."""
+    for part in parts:
+        if isinstance(part, str):
+            with open(part, 'rb') as f:
+                yield from _iter_parts((f,))
+        elif hasattr(part, 'read'):
+            while True:
+                chunk = part.read(_UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            yield part
+
+
+@micropython.native
 def _encode_multipart_form_data(fields, files=None):
     """Encode form data and files as multipart/form-data.
     
+    The body is returned as a sequence of chunks rather than one bytes
+    object. In-memory content is passed through as a memoryview, and a
+    file path or file object is read in small chunks while sending, so
+    file content is never copied into a second image-sized buffer.
+    
     Args:
         fields: dict of field_name -> value for regular form fields
         files: dict of field_name -> {'filename': str, 'content': bytes, 'content_type': str}
+               where content may also be a file path or a readable file object
     
     Returns:
-        tuple: (body_bytes, content_type_header)
+        tuple: (parts_iter, content_length, content_type_header)
     """
     boundary = _generate_boundary()
-    lines = []
+    boundary_b = boundary.encode()
+    delimiter = b'--' + boundary_b + b'\r\n'
+    parts = []
     
     # Add regular fields
     if fields:
         for name, value in fields.items():
-            lines.append('--' + boundary)
-            lines.append('Content-Disposition: form-data; name="%s"' % name)
-            lines.append('')
-            lines.append(str(value))
+            parts.append(b''.join((
+                delimiter,
+                b'Content-Disposition: form-data; name="', str(name).encode(), b'"\r\n\r\n',
+                str(value).encode(), b'\r\n',
+            )))
     
     # Add file fields
     if files:
         for field_name, file_info in files.items():
-            lines.append('--' + boundary)
             filename = file_info.get('filename', 'file')
             content_type = file_info.get('content_type', 'application/octet-stream')
-            lines.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (field_name, filename))
-            lines.append('Content-Type: %s' % content_type)
-            lines.append('')
-            lines.append('__BINARY_CONTENT_%s__' % field_name)
+            parts.append(b''.join((
+                delimiter,
+                b'Content-Disposition: form-data; name="', field_name.encode(),
+                b'"; filename="', filename.encode(), b'"\r\n',
+                b'Content-Type: ', content_type.encode(), b'\r\n\r\n',
+            )))
+            content = file_info['content']
+            if isinstance(content, (bytes, bytearray)):
+                content = memoryview(content)
+            parts.append(content)
+            parts.append(b'\r\n')
     
-    lines.append('--' + boundary + '--')
-    lines.append('')
+    parts.append(b'--' + boundary_b + b'--\r\n')
     
-    # Create the body with proper binary handling
-    body_parts = []
-    text_body = '\r\n'.join(lines)
+    content_length = 0
+    for part in parts:
+        content_length += _content_length(part)
     
-    if files:
-        # Split and rebuild with binary content
-        for field_name, file_info in files.items():
-            placeholder = '__BINARY_CONTENT_%s__' % field_name
-            if placeholder in text_body:
-                parts = text_body.split(placeholder)
-                body_parts.append(parts[0].encode('utf-8'))
-                body_parts.append(file_info['content'])
-                text_body = placeholder.join(parts[1:])  # Remaining parts
-        
-        # Add final part
-        if text_body:
-            body_parts.append(text_body.encode('utf-8'))
+    content_type = 'multipart/form-data; boundary=' + boundary
+    return _iter_parts(parts), content_length, content_type
+
+
+def _file_positions(multipart_data):
+    """Return (file object, offset) for each file object in a multipart body.
+
+    Used to rewind file content before the body is sent a second time.
+    """
+    if not multipart_data:
+        return ()
+    return [(f['content'], f['content'].tell())
+            for f in (multipart_data.get('files') or {}).values()
+            if hasattr(f.get('content'), 'read')]
+
+
+# A dict with a list value longer than this (log lines, events) is streamed
+# key by key; anything else is small and goes out as one write (each write
+# is its own TLS record and TCP segment)
+_JSON_STREAM_MIN_ITEMS = 32
+
+
+def _json_item(sep, key, value):
+    return sep + json.dumps(str(key)).encode('utf-8') + b':' + json.dumps(value).encode('utf-8')
+
+
+def _iter_json_chunks(obj):
+    """Yield a dict as encoded JSON, one chunk per key, built as it is sent."""
+    yield b'{'
+    sep = b''
+    for key, value in obj.items():
+        yield _json_item(sep, key, value)
+        sep = b','
+    yield b'}'
+
+
+def _is_large_json(obj):
+    """Cheaply spot a dict that carries a long list, without encoding it."""
+    for value in obj.values():
+        if isinstance(value, (list, tuple)) and len(value) > _JSON_STREAM_MIN_ITEMS:
+            return True
+    return False
+
+
+def _encode_json(obj):
+    """Serialize a dict for a request body.
+
+    Ordinary bodies are encoded once, in one piece. Bodies carrying a long
+    list are measured key by key here and encoded again one key at a time
+    while sending, so the full payload is never held in memory at once.
+
+    Returns:
+        tuple: (body, content_length); body is bytes or an iterator of chunks
+    """
+    if not _is_large_json(obj):
+        body = json.dumps(obj).encode('utf-8')
+        return body, len(body)
+    content_length = 2  # braces
+    sep = b''
+    for key, value in obj.items():
+        content_length += len(_json_item(sep, key, value))
+        sep = b','
+    return _iter_json_chunks(obj), content_length
+
+
+def _parse_url(url):
+    """Split an http(s) URL into (scheme, host, port, path)."""
+    scheme, _, rest = url.partition('://')
+    i = rest.find('/')
+    if i < 0:
+        host, path = rest, '/'
     else:
-        body_parts.append(text_body.encode('utf-8'))
-    
-    # Combine all parts
-    body = b''
-    for part in body_parts:
-        if isinstance(part, str):
-            body += part.encode('utf-8')
+        host, path = rest[:i], rest[i:]
+    port = 443 if scheme == 'https' else 80
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = int(port)
+    return scheme, host, port, path
+
+
+# Not every port exposes these constants; missing ones are skipped
+_SOCKET_OPTIONS = [
+    (getattr(socket, level, None), getattr(socket, name, None))
+    for level, name in (('IPPROTO_TCP', 'TCP_NODELAY'), ('SOL_SOCKET', 'SO_KEEPALIVE'))
+]
+
+
+def _tune_socket(sock):
+    """Disable Nagle and enable TCP keep-alive where the port supports it.
+
+    A request goes out as separate header and body writes; with Nagle on,
+    the second write waits for the server's delayed ACK of the first.
+    """
+    for level, opt in _SOCKET_OPTIONS:
+        if level is None or opt is None:
+            continue
+        try:
+            sock.setsockopt(level, opt, 1)
+        except OSError:
+            pass
+
+
+# Write errors showing the server closed an idle keep-alive connection
+_STALE_WRITE_ERRNOS = (errno.ECONNRESET, getattr(errno, 'EPIPE', 32))
+
+
+class _StaleConnection(OSError):
+    """The server closed a kept-alive connection before reading the request.
+
+    Nothing has been processed, so the request can safely be resent.
+    """
+
+
+class _Response:
+    """Fully-read HTTP response with the urequests.Response methods we use."""
+    def __init__(self, status_code, content, etag=None):
+        self.status_code = status_code
+        self.content = content
+        self.etag = etag
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        pass
+
+
+class _HttpConnection:
+    """HTTP/1.1 connection to one host, kept alive between requests.
+
+    Reusing the socket saves a TCP connect and TLS handshake on every
+    request after the first.
+    """
+    def __init__(self, scheme, host, port, timeout_s=10):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout_s = timeout_s
+        self.sock = None
+
+    def connect(self):
+        addr = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0][-1]
+        sock = socket.socket()
+        try:
+            sock.settimeout(self.timeout_s)
+            _tune_socket(sock)
+            sock.connect(addr)
+            if self.scheme == 'https':
+                sock = ssl.wrap_socket(sock, server_hostname=self.host)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+            self.sock = None
+
+    def request(self, method, path, headers, body=None, content_length=0):
+        """Send a request and read the whole response.
+
+        Args:
+            body: bytes, or an iterable of bytes-like chunks
+            content_length: total body size in bytes
+
+        Returns:
+            _Response
+        """
+        if self.sock is None:
+            self.connect()
+        sock = self.sock
+
+        head = ['%s %s HTTP/1.1\r\nHost: %s\r\n' % (method, path, self.host)]
+        for k, v in headers.items():
+            head.append('%s: %s\r\n' % (k, v))
+        if body is not None:
+            head.append('Content-Length: %d\r\n' % content_length)
+        head.append('Connection: keep-alive\r\n\r\n')
+        try:
+            sock.write(''.join(head).encode('utf-8'))
+
+            if body is not None:
+                if isinstance(body, (bytes, bytearray, memoryview)):
+                    sock.write(body)
+                else:
+                    for chunk in body:
+                        sock.write(chunk)
+        except OSError as e:
+            if e.args and e.args[0] in _STALE_WRITE_ERRNOS:
+                raise _StaleConnection(e.args[0])
+            raise
+
+        return self._read_response(method)
+
+    def _read_response(self, method):
+        sock = self.sock
+        line = sock.readline()
+        if not line:
+            # Server closed an idle keep-alive connection
+            raise _StaleConnection('Connection closed by server')
+        status = int(line.split(None, 2)[1])
+
+        content_length = None
+        chunked = False
+        keep_alive = True
+        etag = None
+        while True:
+            line = sock.readline()
+            if not line or line == b'\r\n':
+                break
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == b'content-length':
+                content_length = int(value)
+            elif name == b'transfer-encoding':
+                chunked = value.lower() == b'chunked'
+            elif name == b'connection':
+                keep_alive = value.lower() != b'close'
+            elif name == b'etag':
+                etag = value.decode()
+
+        if method == 'HEAD' or status in (204, 304):
+            content = b''
+        elif chunked:
+            parts = []
+            while True:
+                size = int(sock.readline().split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    # Skip any trailers
+                    while sock.readline() not in (b'\r\n', b''):
+                        pass
+                    break
+                parts.append(self._read_exact(size))
+                sock.readline()
+            content = b''.join(parts)
+        elif content_length is not None:
+            content = self._read_exact(content_length)
         else:
-            body += part
-    
-    content_type = 'multipart/form-data; boundary=' + boundary
-    return body, content_type
+            # No framing: the body runs until the server closes the socket
+            parts = []
+            while True:
+                chunk = sock.read(1024)
+                if not chunk:
+                    break
+                parts.append(chunk)
+            content = b''.join(parts)
+            keep_alive = False
+
+        if not keep_alive:
+            self.close()
+        return _Response(status, content, etag)
+
+    def _read_exact(self, n):
+        buf = bytearray(n)
+        mv = memoryview(buf)
+        pos = 0
+        while pos < n:
+            r = self.sock.readinto(mv[pos:])
+            if not r:
+                raise OSError('Connection closed mid-response')
+            pos += r
+        return bytes(buf)
+
+
+# Query string asking the server to embed the firmware manifest in a response
+_CHECK_FIRMWARE_PARAMS = {'checkFirmware': 1}
+
+# Placeholder for a value that has not been loaded yet
+_UNREAD = object()
 
 
 class IotManagerClient:
@@ -141,29 +475,56 @@ class IotManagerClient:
 
         self._endpoints = {} 
         self._available_methods = []
+        self._dispatch = {}  # method name -> call bound to its endpoint
+        self._conns = {}  # (scheme, host, port) -> _HttpConnection
+        self._firmware_version = _UNREAD
+        self.bootstrap_supported = None  # unknown until bootstrap() has been tried
         if auto_discover:
             self.discover()
 
     def discover(self):
         data = self._request_raw('GET', self.base_url)
-        endpoints = data.get('endpoints', []) if isinstance(data, dict) else []
+        self._load_endpoints(data.get('endpoints', []) if isinstance(data, dict) else [])
+        return data
 
+    def _load_endpoints(self, endpoints):
+        """Index the server's endpoint list and bind a dispatcher per method."""
         self._endpoints = {}
         self._available_methods = []
+        self._dispatch = {}
 
         for ep in endpoints:
             desc = ep.get('description', '')
             method = (ep.get('method', '') or '').upper()
             path = ep.get('path', '')
+            url = _join_url(self.base_url, path)
             self._endpoints[desc] = {
                 'method': method,
                 'path': path,
-                'url': _join_url(self.base_url, path),
+                'url': url,
+                'parsed_url': _parse_url(url),
             }
             m = self._description_to_method_name(desc)
             if m:
                 self._available_methods.append(m)
-        return data
+                call = self._make_dispatcher(self._endpoints[desc])
+                if call:
+                    self._dispatch[m] = call
+
+    def _make_dispatcher(self, ep):
+        """Bind an endpoint's HTTP method and URL into a call for _call_discovered."""
+        url = ep['url']
+        parsed_url = ep['parsed_url']
+        if ep['method'] == 'GET':
+            def call(data, params, multipart_data):
+                return self._request_raw('GET', url, params=params, parsed_url=parsed_url)
+            return call
+        if ep['method'] == 'POST':
+            def call(data, params, multipart_data):
+                return self._request_raw('POST', url, params=params, json_body=data,
+                                         multipart_data=multipart_data, parsed_url=parsed_url)
+            return call
+        return None
 
     def get_available_methods(self):
         return list(self._available_methods)
@@ -172,72 +533,125 @@ class IotManagerClient:
         return dict(self._endpoints)
 
     def _description_to_method_name(self, description):
-        mapping = {
-            'GetLatestVersion': 'get_latest_version',
-            'CreateDeviceStatus': 'create_device_status',
-            'CreateContent': 'create_content',
-            'Authenticate': 'authenticate',
-            'GetConfig': 'get_config',
-        }
-        return mapping.get(description)
+        return _DESC_TO_METHOD.get(description)
 
     def _method_name_to_description(self, method_name):
-        rev = {
-            'get_latest_version': 'GetLatestVersion',
-            'create_device_status': 'CreateDeviceStatus',
-            'create_content': 'CreateContent',
-            'authenticate': 'Authenticate',
-            'get_config': 'GetConfig',
-        }
-        return rev.get(method_name)
+        return _METHOD_TO_DESC.get(method_name)
 
-    def _headers(self, extra=None, json_body=False):
+    @property
+    def authorization(self):
+        return self._authorization
+
+    @authorization.setter
+    def authorization(self, value):
+        # Rebuild the shared header dicts whenever the token changes
+        self._authorization = value
         h = {
             'Accept': 'application/json',
         }
-        if self.authorization:
-            h['Authorization'] = self.authorization
-        if json_body:
-            h['Content-Type'] = 'application/json'
-        if extra:
-            h.update(extra)
+        if value:
+            h['Authorization'] = value
+        self._base_headers = h
+        self._json_headers = dict(h)
+        self._json_headers['Content-Type'] = 'application/json'
+
+    def _headers(self, extra=None, json_body=False):
+        """Return request headers; the result is shared and must not be mutated."""
+        if not extra:
+            return self._json_headers if json_body else self._base_headers
+        h = dict(self._json_headers if json_body else self._base_headers)
+        h.update(extra)
         return h
 
-    def _request_raw(self, method, url, params=None, json_body=None, multipart_data=None):
-        """Return parsed JSON dict/list (or raise)."""
-        gc.collect()
-        if params and method.upper() == 'GET':
-            qs = _encode_qs(params)
-            if qs:
-                url = url + ('&' if '?' in url else '?') + qs
+    def _get_conn(self, scheme, host, port):
+        key = (scheme, host, port)
+        conn = self._conns.get(key)
+        if conn is None:
+            conn = self._conns[key] = _HttpConnection(scheme, host, port, self.timeout_s)
+        return conn
+
+    def close(self):
+        """Close any kept-alive server connections."""
+        for conn in self._conns.values():
+            conn.close()
 
-        body = None
-        headers = None
+    def _encode_body(self, json_body=None, multipart_data=None, extra_headers=None):
+        """Return (body, content_length, headers) for a request."""
+        body, content_length, headers = self._encode_payload(json_body, multipart_data)
+        if extra_headers:
+            headers = dict(headers)
+            headers.update(extra_headers)
+        return body, content_length, headers
+
+    def _encode_payload(self, json_body=None, multipart_data=None):
         if multipart_data is not None:
+            # Uploads carry image-sized content; small JSON requests skip the collect
+            gc.collect()
             fields = multipart_data.get('fields', {})
             files = multipart_data.get('files', {})
-            body, content_type = _encode_multipart_form_data(fields, files)
-            headers = self._headers(extra={'Content-Type': content_type})
-        elif json_body is not None:
-            body = json.dumps(json_body)
-            headers = self._headers(json_body=True)
-        else:
-            headers = self._headers()
+            body, content_length, content_type = _encode_multipart_form_data(fields, files)
+            if DEBUG:
+                print("Multipart body size:", content_length)
+            return body, content_length, self._headers(extra={'Content-Type': content_type})
+        if isinstance(json_body, dict):
+            body, content_length = _encode_json(json_body)
+            return body, content_length, self._headers(json_body=True)
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            return body, len(body), self._headers(json_body=True)
+        return None, 0, self._headers()
+
+    def _request_raw(self, method, url, params=None, json_body=None, multipart_data=None, parsed_url=None,
+                     extra_headers=None, raw=False):
+        """Return parsed JSON dict/list (or raise).
+
+        parsed_url is the cached (scheme, host, port, path) of a discovered
+        endpoint, which saves re-parsing url on every call. extra_headers are
+        added to the request. With raw=True the _Response itself is returned
+        and 304 Not Modified is not treated as an error.
+        """
+        method = method.upper()
+        scheme, host, port, path = parsed_url or _parse_url(url)
+        if params:
+            qs = _encode_qs(params)
+            if qs:
+                path = path + ('&' if '?' in path else '?') + qs
+
+        conn = self._get_conn(scheme, host, port)
 
         resp = None
         try:
-            if method.upper() == 'GET':
-                resp = requests.get(url, headers=headers)
-            elif method.upper() == 'POST':
-                resp = requests.post(url, data=body, headers=headers)
-            else:
+            if method not in ('GET', 'POST'):
                 raise IotManagerError('Unsupported HTTP method: %s' % method)
 
-            status = getattr(resp, 'status_code', None)
-            print("Response status:", status)
-            if status is None:
-                status = resp.status
+            # The server may have dropped an idle keep-alive connection, so
+            # retry once on a fresh one - but only when it demonstrably never
+            # got the request, never after e.g. a read timeout, which could
+            # post an upload twice. The body is rebuilt for the retry because
+            # a streamed multipart body can only be sent once.
+            file_positions = _file_positions(multipart_data)
+            for attempt in range(2):
+                reused = conn.sock is not None
+                body, content_length, headers = self._encode_body(json_body, multipart_data, extra_headers)
+                try:
+                    resp = conn.request(method, path, headers, body, content_length)
+                    break
+                except _StaleConnection:
+                    conn.close()
+                    if attempt or not reused:
+                        raise
+                    for file_obj, pos in file_positions:
+                        file_obj.seek(pos)
+                except OSError:
+                    conn.close()
+                    raise
+
+            status = resp.status_code
+            if DEBUG:
+                print("Response status:", status)
 
+            if raw and status == 304:
+                return resp
             if status == 401:
                 raise AuthenticationError('Authentication failed')
             if status == 403:
@@ -247,18 +661,18 @@ class IotManagerClient:
                 try:
                     err = resp.json()
                     if isinstance(err, dict) and 'error' in err:
-                        raise ServerError('Server returned %d: %s' % (status, err.get('error')))
+                        raise ServerError('Server returned %d: %s' % (status, err.get('error')), status)
                 except Exception:
                     pass
-                raise ServerError('Server returned %d' % status)
+                raise ServerError('Server returned %d' % status, status)
 
-            try:
-                return resp.json()
-            except Exception:
-                txt = resp.text
-                if not txt:
-                    return {}
-                return json.loads(txt)
+            if raw:
+                return resp
+            # The body was read bounded by its framing, so parse it once
+            # straight from bytes; an empty body means no data.
+            if not resp.content:
+                return {}
+            return resp.json()
         finally:
             try:
                 if resp is not None:
@@ -267,64 +681,111 @@ class IotManagerClient:
                 pass
 
     def _call_discovered(self, method_name, data=None, params=None, multipart_data=None):
+        call = self._dispatch.get(method_name)
+        if call is not None:
+            return call(data, params, multipart_data)
+
         desc = self._method_name_to_description(method_name)
         if not desc or desc not in self._endpoints:
             raise EndpointNotFoundError('Method not available: %s' % method_name)
+        raise IotManagerError('Unsupported HTTP method: %s' % self._endpoints[desc]['method'])
+    
+    def check_for_firmware_update(self):
+        """Return (latest_version, download_url), or (None, None) if up to date."""
+        return OTAUpdater(self).check_for_update()
 
-        ep = self._endpoints[desc]
-        http_method = ep['method']
-        url = ep['url']
+    def check_and_update_firmware(self, update=None):
+        """Download and apply a firmware update if one is available.
 
-        if http_method == 'GET':
-            return self._request_raw('GET', url, params=params)
-        if http_method == 'POST':
-            return self._request_raw('POST', url, json_body=data, multipart_data=multipart_data)
-        raise IotManagerError('Unsupported HTTP method: %s' % http_method)
-    
-    def check_and_update_firmware(self):
+        Args:
+            update: result of an earlier check_for_firmware_update() call;
+                if None, the server is asked now
+        """
         ota_updater = OTAUpdater(self)
-        return ota_updater.check_and_perform_update()
+        return ota_updater.check_and_perform_update(update)
 
 
     def get_config(self, **params):
         return self._call_discovered('get_config', params=params)
 
+    def get_config_if_changed(self, etag=None, **params):
+        """Fetch the config unless the server's copy still matches etag.
+
+        Args:
+            etag: ETag returned with the previously fetched config, if any
+            **params: query parameters, as for get_config()
+
+        Returns:
+            tuple: (config, etag, status_code); config is None when the
+                server answers 304 Not Modified
+        """
+        ep = self._endpoints.get(self._method_name_to_description('get_config'))
+        if ep is None:
+            raise EndpointNotFoundError('Method not available: get_config')
+        resp = self._request_raw(ep['method'], ep['url'], params=params, parsed_url=ep['parsed_url'],
+                                 extra_headers={'If-None-Match': etag} if etag else None, raw=True)
+        if resp.status_code == 304:
+            return None, etag, 304
+        return (resp.json() if resp.content else {}), resp.etag, resp.status_code
+
     def get_latest_version(self, **params):
         return self._call_discovered('get_latest_version', params=params)
         
     def get_firmware_version(self):
-        try:
-            with open('version.dat', 'r') as f:
-                version = f.read().strip()
-                return version
-        except Exception:
-            return None
+        """Return the installed firmware version, read from flash once per boot."""
+        if self._firmware_version is _UNREAD:
+            try:
+                with open('version.dat', 'r') as f:
+                    self._firmware_version = f.read().strip()
+            except Exception:
+                self._firmware_version = None
+        return self._firmware_version
+
+    def create_device_status(self, status_obj, check_firmware=False):
+        """Report device status.
 
-    def create_device_status(self, status_obj):
-        return self._call_discovered('create_device_status', data=status_obj)
+        With check_firmware, the server is asked to include a
+        'firmwareUpdate' manifest in its response; see firmware_update_from().
+        """
+        params = _CHECK_FIRMWARE_PARAMS if check_firmware else None
+        return self._call_discovered('create_device_status', data=status_obj, params=params)
+
+    def firmware_update_from(self, response):
+        """Read the firmware manifest from a response made with check_firmware.
+
+        Returns:
+            tuple: (latest_version, download_url), (None, None) if no update
+                is needed or the manifest is not a dict, or None if the
+                server sent no manifest (servers that ignore check_firmware)
+        """
+        if not isinstance(response, dict) or 'firmwareUpdate' not in response:
+            return None
+        manifest = response['firmwareUpdate']
+        if not isinstance(manifest, dict):
+            return None, None
+        return OTAUpdater(self).update_from_manifest(manifest)
 
-    def create_content(self, content_obj=None, files=None, **fields):
+    def create_content(self, content_obj=None, files=None, params=None, **fields):
         """Create content on the server.
         
         Args:
             content_obj: JSON data to send (traditional usage)
             files: dict of field_name -> {'filename': str, 'content': bytes, 'content_type': str}
-                   for file uploads (e.g., JPEG images)
+                   for file uploads (e.g., JPEG images); content may also be a
+                   file path or file object, which is streamed from flash
+            params: optional query-string parameters
             **fields: additional form fields for multipart uploads
         
         Example:
             # Traditional JSON usage
             client.create_content({"key": "value"})
             
-            # Multipart form with JPEG image
-            with open('image.jpg', 'rb') as f:
-                image_data = f.read()
-            
+            # Multipart form with JPEG image streamed from flash
             client.create_content(
                 files={
                     'image': {
                         'filename': 'photo.jpg',
-                        'content': image_data,
+                        'content': 'image.jpg',
                         'content_type': 'image/jpeg'
                     }
                 },
@@ -338,19 +799,25 @@ class IotManagerClient:
                 'fields': fields,
                 'files': files or {}
             }
-            return self._call_discovered('create_content', multipart_data=multipart_data)
+            return self._call_discovered('create_content', multipart_data=multipart_data, params=params)
         else:
             # Use traditional JSON
-            return self._call_discovered('create_content', data=content_obj)
+            return self._call_discovered('create_content', data=content_obj, params=params)
 
-    def upload_image(self, image_data, filename=None, device_id=None, description=None, test_post=False, **extra_fields):
+    def upload_image(self, image_data, filename=None, device_id=None, description=None, test_post=False,
+                     status=None, check_firmware=False, **extra_fields):
         """Convenience method to upload a JPEG image.
         
         Args:
-            image_data: bytes of the JPEG image
+            image_data: JPEG image as bytes, a file path, or a readable file object
             filename: optional filename (defaults to 'image.jpg')
             device_id: optional device ID
             description: optional description
+            test_post: mark the upload as a test post
+            status: optional device status dict, sent as a JSON 'status'
+                    field so no separate create_device_status call is needed
+            check_firmware: ask the server to include a 'firmwareUpdate'
+                    manifest in the response; see firmware_update_from()
             **extra_fields: additional form fields
         
         Returns:
@@ -374,9 +841,12 @@ class IotManagerClient:
             fields['description'] = description
         if test_post:
             fields['testPost'] = 'true'
+        if status is not None:
+            fields['status'] = json.dumps(status)
         fields.update(extra_fields)
         
-        return self.create_content(files=files, **fields)
+        params = _CHECK_FIRMWARE_PARAMS if check_firmware else None
+        return self.create_content(files=files, params=params, **fields)
 
     def authenticate(self, device_id, password):
         payload = {"deviceId": device_id, "password": password}
@@ -387,23 +857,107 @@ class IotManagerClient:
         self.authorization = result['authorization']
         return self.authorization
 
+    def bootstrap(self, device_id, password, try_bootstrap=True):
+        """Authenticate, discover endpoints and fetch config in one round-trip.
+
+        Servers without a bootstrap endpoint answer 404 or 405, in which case
+        this falls back to separate authenticate() and discover() calls and
+        sets bootstrap_supported to False. Callers that remember this can pass
+        try_bootstrap=False to skip the failing request next time.
+
+        Args:
+            device_id (str): Device identifier
+            password (str): Device password
+            try_bootstrap (bool): If False, go straight to authenticate()
+                and discover()
+
+        Returns:
+            dict: Unvalidated server config, or None if the server did not
+                send one (the caller should then use get_config())
+        """
+        if try_bootstrap:
+            payload = {"deviceId": device_id, "password": password}
+            try:
+                result = self._request_raw('POST', self.base_url + '/bootstrap', json_body=payload)
+            except ServerError as e:
+                if e.status_code not in (404, 405):
+                    raise
+                self.bootstrap_supported = False
+            else:
+                if not isinstance(result, dict) or 'authorization' not in result:
+                    raise ServerError('Bootstrap did not return authorization')
+                self.bootstrap_supported = True
+                self.authorization = result['authorization']
+                self._load_endpoints(result.get('endpoints', []))
+                return result.get('config')
+        self.authenticate(device_id, password)
+        self.discover()
+        return None
+
 
 class OTAUpdater:
     """Over-the-air updater using IoT Manager."""
     def __init__(self, client: IotManagerClient):
         self.client = client
 
+    def _open_stream(self, url, max_redirects=5):
+        """Open a GET request and return its socket positioned at the body.
+
+        Uses HTTP/1.0 so the body is never chunked and can be fed straight
+        into the decompressor. Redirects are followed, as release
+        downloads are often served from a different host.
+        """
+        for _ in range(max_redirects + 1):
+            scheme, host, port, path = _parse_url(url)
+            conn = _HttpConnection(scheme, host, port, self.client.timeout_s)
+            conn.connect()
+            sock = conn.sock
+            try:
+                sock.write((
+                    'GET %s HTTP/1.0\r\n'
+                    'Host: %s\r\n'
+                    'User-Agent: TimeLapseCam Agent\r\n'
+                    'Accept-Encoding: identity\r\n'
+                    'Connection: close\r\n'
+                    '\r\n' % (path, host)
+                ).encode('utf-8'))
+
+                status = int(sock.readline().split(None, 2)[1])
+                print("Download response status:", status)
+                location = None
+                while True:
+                    line = sock.readline()
+                    if not line or line == b'\r\n':
+                        break
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'location':
+                        location = value.strip().decode('utf-8')
+            except Exception:
+                conn.close()
+                raise
+
+            if status in (301, 302, 303, 307, 308) and location:
+                conn.close()
+                if location.startswith('/'):
+                    location = scheme + '://' + host + location
+                url = location
+                continue
+            if status != 200:
+                conn.close()
+                raise ServerError('Firmware download returned %d' % status, status)
+            return sock
+        raise ServerError('Too many redirects downloading firmware')
+
     def _normalize_tar_path(self, tar_name: str):
         if not tar_name:
             return None
 
         name = tar_name.replace('\\', '/')
-        while name.startswith('./'):
+        while name[:2] == './':
             name = name[2:]
-        while name.startswith('/'):
-            name = name[1:]
+        name = name.lstrip('/')
 
-        if name == '' or name == '.' or name.startswith('../') or '/..' in name:
+        if not name or name == '.' or '..' in name.split('/'):
             return None
 
         # Keep already-rooted firmware paths
@@ -411,22 +965,30 @@ class OTAUpdater:
             return name
 
         # If packaged with a top-level directory, strip exactly one component
-        if '/' in name:
-            _, remainder = name.split('/', 1)
-            if remainder == 'main.py' or remainder.startswith('lib/'):
-                return remainder
+        _, sep, remainder = name.partition('/')
+        if sep and (remainder == 'main.py' or remainder.startswith('lib/')):
+            return remainder
 
         return None
 
-    def _ensure_parent_dirs(self, rel_path: str):
+    def _ensure_parent_dirs(self, rel_path: str, created_dirs=None):
+        """Create the parent directories of rel_path.
+
+        Directories recorded in created_dirs are skipped, and new ones are
+        added to it, so one set can be shared across a whole archive.
+        """
         if not rel_path or '/' not in rel_path:
             return
+        if created_dirs is None:
+            created_dirs = set()
         parts = rel_path.split('/')[:-1]
         acc = ''
         for part in parts:
             if not part:
                 continue
             acc = part if not acc else acc + '/' + part
+            if acc in created_dirs:
+                continue
             try:
                 uos.mkdir(acc)
             except OSError as e:
@@ -437,9 +999,13 @@ class OTAUpdater:
                         uos.stat(acc)
                     except Exception:
                         raise
+            created_dirs.add(acc)
 
     def check_for_update(self):
-        data = self.client.get_latest_version()
+        return self.update_from_manifest(self.client.get_latest_version())
+
+    def update_from_manifest(self, data):
+        """Return (latest_version, download_url) if data names a newer version, else (None, None)."""
         latest_version = data.get('version')
         download_url = data.get('url')
         print("Latest version:", latest_version, "Download URL:", download_url)
@@ -450,73 +1016,80 @@ class OTAUpdater:
                 return latest_version, download_url
         return None, None
 
-    def check_and_perform_update(self):
-        tmp_filename = '/ota_version.tmp'
+    def _remove_staged(self, staged):
+        """Delete staged '.new' files left by an interrupted update."""
+        for file_name in staged:
+            try:
+                uos.remove(file_name + '.new')
+            except OSError:
+                pass
+
+    def check_and_perform_update(self, update=None):
         gc.collect()
-        latest_version, download_url = self.check_for_update()
+        latest_version, download_url = update or self.check_for_update()
         if latest_version and download_url:
             print(f"Updating to {latest_version}, downloading from {download_url} ...")
-            response = requests.get(download_url, headers={"User-Agent": "TimeLapseCam Agent"}, stream=True)
-            print("Download response status:", response.status_code)
-            with open(tmp_filename, 'wb') as f:
-                print("Writing to temporary file:", tmp_filename)
-                while True:
-                    chunk = response.raw.read(512)
-                    print("Downloaded chunk size:", len(chunk))
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    print("Wrote chunk to file.")
-            
-            gc.collect()
+            sock = self._open_stream(download_url)
+            # Members are extracted to '<name>.new' and only renamed over the
+            # running firmware once the whole archive has been read, so a
+            # dropped connection or power cut mid-download leaves it intact.
+            staged = []
             try:
-                uos.stat(tmp_filename)
-            except OSError:
-                print('No new firmware file found in flash.')
-                return
-            with open(tmp_filename, 'rb') as f1:
-                f2 = deflate.DeflateIO(f1, deflate.GZIP)
+                gc.collect()
+                # Decompress and extract straight from the socket, so the
+                # archive itself is never written to flash.
+                f2 = deflate.DeflateIO(sock, deflate.GZIP)
                 f3 = tarfile.TarFile(fileobj=f2)
+                buf = bytearray(_OTA_CHUNK_SIZE)
+                mv = memoryview(buf)
+                created_dirs = set()
                 for _file in f3:
                     raw_name = getattr(_file, 'name', None)
                     file_name = self._normalize_tar_path(raw_name)
-                    print(f'Extracting file: {raw_name} -> {file_name} ... ')
+                    if DEBUG:
+                        print(f'Extracting file: {raw_name} -> {file_name} ... ')
                     if not file_name:
                         continue
 
-                    # Directory entries (some tars include them)
+                    # Directory entries (some tars include them); the trailing
+                    # slash makes the directory itself count as a parent
                     if file_name.endswith('/'):
-                        dir_name = file_name[:-1]
-                        if dir_name:
-                            try:
-                                uos.mkdir(dir_name)
-                            except OSError as e:
-                                if getattr(e, 'errno', None) != 17:
-                                    try:
-                                        uos.stat(dir_name)
-                                    except Exception:
-                                        raise
+                        self._ensure_parent_dirs(file_name, created_dirs)
                         continue
 
-                    self._ensure_parent_dirs(file_name)
+                    self._ensure_parent_dirs(file_name, created_dirs)
                     file_obj = f3.extractfile(_file)
-                    with open(file_name, 'wb') as f_out:
+                    staged.append(file_name)
+                    with open(file_name + '.new', 'wb') as f_out:
                         written_bytes = 0
                         while True:
-                            buf = file_obj.read(512)
-                            if not buf:
+                            n = file_obj.readinto(buf)
+                            if not n:
                                 break
-                            written_bytes += f_out.write(buf)
-                        print(f'file {file_name} ({written_bytes} B) written to flash')
-
-            print("Deleting temporary file:", tmp_filename)
-            uos.remove(tmp_filename)
+                            written_bytes += f_out.write(mv[:n])
+                        print(f'file {file_name} ({written_bytes} B) staged')
+                    # Keep fragmentation down across many archive members
+                    gc.collect()
+            except Exception:
+                self._remove_staged(staged)
+                raise
+            finally:
+                sock.close()
+                sock = None
+                gc.collect()
 
+            if not staged:
+                raise IotManagerError('Firmware archive contained no files')
+            for file_name in staged:
+                uos.rename(file_name + '.new', file_name)
             print("Update applied successfully. write new version file.")
-            with open('version.dat', 'w') as f:
+            # Rename into place so a power cut can't leave a truncated version file
+            with open('version.dat.new', 'w') as f:
                 f.write(latest_version)
+            uos.rename('version.dat.new', 'version.dat')
+            self.client._firmware_version = latest_version
             print("Restarting device to apply update...")
             time.sleep(2)
             machine.reset()
         print("No update available.")
-        return False
\ No newline at end of file
+        return False
@@ -34,6 +34,8 @@ class Logger:
         3: 'ERROR',
     }
     
+    _level_numbers = {name: level for level, name in LEVEL_NAMES.items()}
+    
     def __init__(self, level='INFO', enable_file=False):
         """
         Initialize the logger.
@@ -46,93 +48,144 @@ class Logger:
         self.level = self._parse_level(level)
         self.enable_file = enable_file and LOG_CONFIG.get('file_enabled', False)
         self.log_file = STATE_CONFIG.get('log_file', 'device.log')
-        self.logs = []  # In-memory circular buffer
         self.max_logs = STATE_CONFIG.get('max_log_entries', 100)
+        self.file_flush_lines = LOG_CONFIG.get('file_flush_lines', 32)
+        self._fp = None  # Log file handle, opened on first write
+        self._lines_since_flush = 0
+        self.clear_logs()
     
     def _parse_level(self, level_name):
         """Parse log level name to number."""
-        level_map = {
-            'DEBUG': self.DEBUG,
-            'INFO': self.INFO,
-            'WARN': self.WARN,
-            'ERROR': self.ERROR,
-        }
-        return level_map.get(level_name.upper(), self.INFO)
+        return self._level_numbers.get(level_name.upper(), self.INFO)
     
     def _timestamp(self):
-        """Get current timestamp as milliseconds since boot."""
+        """Get current timestamp as milliseconds since boot (monotonic)."""
         try:
+            return time.ticks_ms()
+        except AttributeError:
             return int(time.time() * 1000)
-        except:
-            return 0
     
-    def _format_message(self, level, message):
+    def _format_message(self, timestamp, level_name, message):
         """Format log message with timestamp and level."""
-        level_name = self.LEVEL_NAMES.get(level, 'UNKNOWN')
-        timestamp = self._timestamp()
         return f"[{timestamp}] [{level_name}] {message}"
     
-    def _write_to_memory(self, level, message):
-        """Store log in memory buffer."""
-        log_entry = {
-            'timestamp': self._timestamp(),
-            'level': self.LEVEL_NAMES.get(level, 'UNKNOWN'),
-            'message': message,
-        }
-        self.logs.append(log_entry)
+    def _write_to_memory(self, timestamp, level, message):
+        """
+        Store log in memory buffer.
         
-        # Maintain circular buffer
-        if len(self.logs) > self.max_logs:
-            self.logs.pop(0)
+        Entries are kept as (timestamp, level, message) tuples; dicts are
+        only built when logs are read back.
+        """
+        # Overwrite the oldest slot of the circular buffer
+        ring = self._ring
+        evicted = ring[self._next]
+        if evicted is not None:
+            self._level_counts[evicted[1]] -= 1
+        ring[self._next] = (timestamp, level, message)
+        self._next = (self._next + 1) % self.max_logs
+        if self._size < self.max_logs:
+            self._size += 1
+        self._level_counts[level] += 1
+    
+    def _entries(self):
+        """Stored (timestamp, level, message) tuples, oldest first."""
+        ring = self._ring
+        if self._size < self.max_logs:
+            return ring[:self._size]
+        return ring[self._next:] + ring[:self._next]
+    
+    def _entry_dict(self, entry):
+        return {
+            'timestamp': entry[0],
+            'level': self.LEVEL_NAMES.get(entry[1], 'UNKNOWN'),
+            'message': entry[2],
+        }
+    
+    @property
+    def logs(self):
+        """Stored log entries, oldest first."""
+        return [self._entry_dict(e) for e in self._entries()]
     
-    def _write_to_file(self, formatted_message):
-        """Append log message to file."""
+    def _write_to_file(self, level, formatted_message):
+        """
+        Append log message to file.
+        
+        The file stays open between calls and is flushed every
+        file_flush_lines lines, or immediately for warnings and errors.
+        """
         if not self.enable_file:
             return
         
         try:
-            with open(self.log_file, 'a') as f:
-                f.write(formatted_message + '\n')
+            if self._fp is None:
+                self._fp = open(self.log_file, 'a')
+            self._fp.write(formatted_message + '\n')
+            self._lines_since_flush += 1
+            if level >= self.WARN or self._lines_since_flush >= self.file_flush_lines:
+                self.flush()
         except Exception as e:
             print(f"WARNING: Failed to write to log file: {e}")
     
-    def _log(self, level, message):
-        """Internal log method."""
+    def flush(self):
+        """Flush buffered log lines to the log file."""
+        if self._fp is not None:
+            self._fp.flush()
+        self._lines_since_flush = 0
+    
+    def close(self):
+        """Flush and close the log file."""
+        if self._fp is not None:
+            self.flush()
+            self._fp.close()
+            self._fp = None
+    
+    def _log(self, level, message, args=()):
+        """
+        Internal log method.
+        
+        Messages may be %-style format strings with args, which are only
+        formatted once the level check passes.
+        """
         # Check if message should be logged
         if level < self.level:
             return
         
+        if args:
+            message = message % args
+        
         # Format the message
-        formatted_message = self._format_message(level, message)
+        timestamp = self._timestamp()
+        level_name = self.LEVEL_NAMES.get(level, 'UNKNOWN')
+        formatted_message = self._format_message(timestamp, level_name, message)
         
         # Print to console
         print(formatted_message)
         
         # Store in memory
-        self._write_to_memory(level, message)
+        self._write_to_memory(timestamp, level, message)
         
         # Optionally write to file
-        self._write_to_file(formatted_message)
+        self._write_to_file(level, formatted_message)
     
-    def debug(self, message):
+    def debug(self, message, *args):
         """Log debug message."""
-        self._log(self.DEBUG, message)
+        self._log(self.DEBUG, message, args)
     
-    def info(self, message):
+    def info(self, message, *args):
         """Log info message."""
-        self._log(self.INFO, message)
+        self._log(self.INFO, message, args)
     
-    def warn(self, message):
+    def warn(self, message, *args):
         """Log warning message."""
-        self._log(self.WARN, message)
+        self._log(self.WARN, message, args)
     
-    def warning(self, message):
+    def warning(self, message, *args):
         """Alias for warn()."""
-        self.warn(message)
+        self._log(self.WARN, message, args)
     
-    def error(self, message):
+    def error(self, message, *args):
         """Log error message."""
-        self._log(self.ERROR, message)
+        self._log(self.ERROR, message, args)
     
     def set_level(self, level_name):
         """Change log level at runtime."""
@@ -140,6 +193,10 @@ class Logger:
         self.level_name = level_name.upper()
         self.info(f"Log level changed to {self.level_name}")
     
+    def is_enabled_for(self, level):
+        """Return True if messages at level would be logged."""
+        return level >= self.level
+    
     def get_logs(self, level_filter=None, count=None):
         """
         Retrieve stored log entries.
@@ -151,18 +208,32 @@ class Logger:
         Returns:
             list: List of log entries (dicts with 'timestamp', 'level', 'message')
         """
-        logs = self.logs
+        return [self._entry_dict(e) for e in self._select(level_filter, count)]
+    
+    def _select(self, level_filter=None, count=None):
+        """Stored entry tuples matching a level filter, limited to the last count."""
+        entries = self._entries()
         
         # Filter by level if specified
         if level_filter:
-            level_filter = level_filter.upper()
-            logs = [log for log in logs if log['level'] == level_filter]
+            level = self._level_numbers.get(level_filter.upper())
+            entries = [e for e in entries if e[1] == level]
         
         # Return last N entries if specified
         if count and count > 0:
-            return logs[-count:]
+            entries = entries[-count:]
         
-        return logs
+        return entries
+    
+    def _iter_logs_json(self, level_filter=None, count=None):
+        """Yield a JSON array of log entries piece by piece."""
+        sep = '['
+        for entry in self._select(level_filter, count):
+            yield sep
+            yield json.dumps(self._entry_dict(entry))
+            sep = ','
+        yield '[]' if sep == '[' else ']'
+
     
     def get_logs_json(self, level_filter=None, count=None):
         """
@@ -175,23 +246,39 @@ class Logger:
         Returns:
             str: JSON-encoded log entries
         """
-        logs = self.get_logs(level_filter=level_filter, count=count)
-        return json.dumps(logs)
+        return ''.join(self._iter_logs_json(level_filter, count))
+    
+    def write_logs_json(self, stream, level_filter=None, count=None):
+        """
+        Write logs as JSON to a stream (file or socket) one entry at a time.
+        
+        Unlike get_logs_json, the JSON for all entries is never built as
+        one string; each entry is encoded and written in turn.
+        
+        Args:
+            stream: Object with a write() method
+            level_filter (str): Only return logs of this level
+            count (int): Return only the last N entries
+        """
+        for piece in self._iter_logs_json(level_filter, count):
+            stream.write(piece)
     
     def clear_logs(self):
         """Clear in-memory log buffer."""
-        self.logs = []
+        # Fixed-size ring: appending never shifts entries, and per-level
+        # counts are kept as entries come and go.
+        self._ring = [None] * self.max_logs
+        self._next = 0
+        self._size = 0
+        self._level_counts = [0] * len(self.LEVEL_NAMES)
     
     def get_stats(self):
         """Get logging statistics."""
-        error_count = len([l for l in self.logs if l['level'] == 'ERROR'])
-        warn_count = len([l for l in self.logs if l['level'] == 'WARN'])
-        
         return {
-            'total_entries': len(self.logs),
+            'total_entries': self._size,
             'max_entries': self.max_logs,
-            'errors': error_count,
-            'warnings': warn_count,
+            'errors': self._level_counts[self.ERROR],
+            'warnings': self._level_counts[self.WARN],
             'level': self.level_name,
         }
 
@@ -234,26 +321,26 @@ def get_logger():
 
 # Convenience functions that use global logger
 
-def debug(message):
+def debug(message, *args):
     """Log debug message."""
-    get_logger().debug(message)
+    get_logger().debug(message, *args)
 
 
-def info(message):
+def info(message, *args):
     """Log info message."""
-    get_logger().info(message)
+    get_logger().info(message, *args)
 
 
-def warn(message):
+def warn(message, *args):
     """Log warning message."""
-    get_logger().warn(message)
+    get_logger().warn(message, *args)
 
 
-def warning(message):
+def warning(message, *args):
     """Log warning message (alias for warn)."""
-    warn(message)
+    warn(message, *args)
 
 
-def error(message):
+def error(message, *args):
     """Log error message."""
-    get_logger().error(message)
+    get_logger().error(message, *args)
@@ -1,5 +1,5 @@
 from lib.iot_manager_client import IotManagerClient
-from lib.wifimgr import WifiManager
+from lib.wifimgr import WifiManager, get_profiles
 from lib.config import (
     WIFI_CONFIG,
     SLEEP_CONFIG,
@@ -7,6 +7,8 @@ from lib.config import (
     CAMERA_TIMING,
     CAMERA_WHITE_BALANCE,
     WAKEUP_CONFIG,
+    CONFIG_CACHE,
+    NTP_CONFIG,
     DEFAULT_WEATHER_CONDITION,
 )
 from lib.logger import get_logger
@@ -20,9 +22,52 @@ from lib.validation import (
     ValidationError,
 )
 import time
+import json
+import network
 import ntptime
+import sys
 import camera
 import machine
+from micropython import const
+try:
+    import _thread
+except ImportError:
+    _thread = None
+try:
+    import traceback
+except ImportError:
+    traceback = None
+
+# Weather condition -> camera white balance constant, resolved once from config
+_WHITE_BALANCE = {weather: getattr(camera, name) for weather, name in CAMERA_WHITE_BALANCE.items()}
+
+_MS_PER_MINUTE = const(60 * 1000)
+_MS_PER_HOUR = const(60 * 60 * 1000)
+
+# machine.wake_reason() value for a deep-sleep timer wakeup (machine.TIMER_WAKE)
+_WAKE_TIMER = const(4)
+
+# Stack for worker threads; camera.init() and NTP go deep into C drivers,
+# and an overflow there crashes the board without reaching deep sleep
+THREAD_STACK_SIZE = 16 * 1024
+
+
+def _start_thread(func):
+    """Run func on a new thread with THREAD_STACK_SIZE, restoring the default afterwards."""
+    old_stack_size = _thread.stack_size(THREAD_STACK_SIZE)
+    try:
+        _thread.start_new_thread(func, ())
+    finally:
+        _thread.stack_size(old_stack_size)
+
+
+def print_exception(e):
+    """Print the traceback of e (MicroPython lacks traceback unless installed)."""
+    if traceback is not None:
+        traceback.print_exc()
+    else:
+        sys.print_exception(e)
+
 
 class Program:
     def __init__(self, iot_manager_base_url, device_id, device_password):
@@ -46,10 +91,23 @@ class Program:
             self.device_id = validate_device_id(device_id)
             self.device_password = validate_password(device_password)
         except ValidationError as e:
-            self.logger.error(f"Invalid parameter: {e}")
+            self.logger.error("Invalid parameter: %s", e)
             raise
         
         self.client = IotManagerClient(base_url=self.iot_manager_base_url)
+        self._default_ms = WAKEUP_CONFIG['default_interval_ms']
+        self._min_ms = WAKEUP_CONFIG['min_interval_ms']
+        self._max_ms = WAKEUP_CONFIG['max_interval_ms']
+        self._test_ms = WAKEUP_CONFIG['test_mode_interval_ms']
+        # esp32_epoch_offset is in seconds; _unix_time_ms() works in ms
+        self._esp32_offset_ms = WAKEUP_CONFIG['esp32_epoch_offset'] * 1000
+        self._rtc = machine.RTC()
+        self._camera_lock = None        # held until the background camera init finishes
+        self._camera_ready_ms = None    # ticks_ms() when camera.init() completed
+        self._camera_error = None
+        self._firmware_update = None    # (version, url) from a check_firmware response
+        self._time_sync_lock = None     # held while NTP sync runs in the background
+        self._rtc_data = self._load_rtc_memory()
         
         # Initialize WiFi manager with config
         wifi_config = WIFI_CONFIG
@@ -59,7 +117,7 @@ class Program:
             authmode=wifi_config['authmode']
         )
         
-        self.logger.info(f"Program initialized with device ID: {self.device_id}")
+        self.logger.info("Program initialized with device ID: %s", self.device_id)
         self.state.record_boot()
 
     def connect_wifi(self, enter_captive_portal_if_needed):
@@ -68,28 +126,203 @@ class Program:
         wlan = self.wifi_manager.get_connection(enter_captive_portal_if_needed=enter_captive_portal_if_needed)
         if wlan is None:
             self.logger.error("Could not initialize network connection")
-            self.logger.info(f"Entering deep sleep for {SLEEP_CONFIG['wifi_failure_sleep_ms'] / 1000 / 60:.0f} minutes")
+            self.logger.info("Entering deep sleep for %.0f minutes", SLEEP_CONFIG['wifi_failure_sleep_ms'] / _MS_PER_MINUTE)
             self.state.record_wifi_failure()
+            self.state.flush(force=True)
+            self.logger.close()
             # Sleep then retry automatically
             machine.deepsleep(SLEEP_CONFIG['wifi_failure_sleep_ms'])
 
-        self.logger.info(f"Network connected: {wlan.ifconfig()}")
-        try:
-            ntptime.settime()
-            self.logger.info(f"System time synchronized: {time.time()}")
-        except Exception as e:
-            self.logger.warn(f"Failed to synchronize time: {e}")
+        self.logger.info("Network connected: %s", wlan.ifconfig())
+        self._tune_wifi(wlan)
+        self._start_time_sync()
         
         self.state.record_wifi_success()
         return wlan
         
-    def take_photo(self, weather_condition, test_post=False):
+    def _start_time_sync(self):
+        """
+        Run _sync_time() on a background thread where _thread is available.
+        
+        The NTP exchange then overlaps the first HTTPS request. Call
+        _wait_for_time_sync() before anything reads the clock.
+        """
+        if _thread is None:
+            self._sync_time()
+            return
+        lock = _thread.allocate_lock()
+        lock.acquire()
+
+        def run():
+            try:
+                self._sync_time()
+            finally:
+                lock.release()
+
+        try:
+            _start_thread(run)
+            self._time_sync_lock = lock
+        except Exception as e:
+            self.logger.warn("Time sync thread failed to start: %s", e)
+            self._sync_time()
+
+    def _wait_for_time_sync(self):
+        """Block until a background NTP sync, if any, has finished."""
+        lock, self._time_sync_lock = self._time_sync_lock, None
+        if lock is not None:
+            lock.acquire()
+            lock.release()
+
+    def _sync_time(self):
+        """
+        Set the RTC from NTP unless it was synced recently.
+        
+        The RTC keeps running through deep sleep, so frequent wakes (test
+        mode, WiFi retries) can skip the NTP round-trip. The resync interval
+        bounds how far the sleep clock can drift. Failed attempts are
+        retried with exponential backoff.
+        """
+        now = time.time()
+        last_sync = self._rtc_data.get('ntp_synced_at')
+        if last_sync and 0 <= now - last_sync < NTP_CONFIG['resync_interval_s']:
+            self.logger.info("Skipping NTP sync, last synced %ss ago", now - last_sync)
+            return
+
+        attempts = NTP_CONFIG['attempts']
+        delay_ms = NTP_CONFIG['retry_delay_ms']
+        for attempt in range(attempts):
+            try:
+                ntptime.settime()
+                self.logger.info("System time synchronized: %s", time.time())
+                self._rtc_data['ntp_synced_at'] = time.time()
+                self._save_rtc_memory()
+                return
+            except Exception as e:
+                self.logger.warn("Failed to synchronize time (attempt %s/%s): %s", attempt + 1, attempts, e)
+            if attempt + 1 < attempts:
+                time.sleep_ms(delay_ms)
+                delay_ms *= 2
+
+    def _tune_wifi(self, wlan):
+        """
+        Trade idle radio power for lower latency while the device is awake.
+        
+        Modem sleep makes every request wait for a DTIM beacon. The device
+        deep-sleeps within seconds of connecting, so keeping the radio on
+        shortens the awake window and saves energy overall.
+        
+        Args:
+            wlan: Connected station interface
+        """
+        if WIFI_CONFIG['disable_power_save']:
+            try:
+                wlan.config(pm=network.WLAN.PM_NONE)
+            except Exception as e:
+                self.logger.warn("Could not disable WiFi power save: %s", e)
+
+        rssi = self.wifi_manager.get_signal_strength()
+        if rssi is not None and rssi < WIFI_CONFIG['weak_signal_rssi']:
+            try:
+                wlan.config(txpower=WIFI_CONFIG['max_txpower_dbm'])
+                self.logger.info("Weak signal (%s dBm), TX power raised", rssi)
+            except Exception as e:
+                self.logger.warn("Could not raise WiFi TX power: %s", e)
+
+    def _init_camera(self):
+        try:
+            try:
+                camera.init(0, format=camera.JPEG, fb_location=camera.PSRAM,
+                            fb_count=CAMERA_CONFIG['fb_count'])
+            except TypeError:
+                # Driver builds without the fb_count argument
+                camera.init(0, format=camera.JPEG, fb_location=camera.PSRAM)
+            self._camera_ready_ms = time.ticks_ms()
+        except Exception as e:
+            self._camera_error = e
+        finally:
+            if self._camera_lock:
+                self._camera_lock.release()
+
+    def start_camera(self):
+        """
+        Start camera initialisation so it overlaps the network handshake.
+        
+        Runs camera.init() on a background thread where _thread is
+        available, otherwise inline. take_photo() waits for it and only
+        sleeps for whatever part of the stabilize delay is still left.
+        """
+        if _thread is None:
+            self._init_camera()
+            return
+        self._camera_lock = _thread.allocate_lock()
+        self._camera_lock.acquire()
+        try:
+            _start_thread(self._init_camera)
+        except Exception as e:
+            self.logger.warn("Camera init thread failed to start: %s", e)
+            self._init_camera()
+
+    def _wait_for_camera(self):
+        """Block until the camera is initialised."""
+        if self._camera_lock:
+            self._camera_lock.acquire()
+            self._camera_lock.release()
+            self._camera_lock = None
+        if self._camera_error is not None:
+            error, self._camera_error = self._camera_error, None
+            raise error
+        if self._camera_ready_ms is None:
+            self._init_camera()
+            if self._camera_error is not None:
+                error, self._camera_error = self._camera_error, None
+                raise error
+
+    def _wait_for_exposure(self):
+        """
+        Capture warm-up frames until auto-exposure settles.
+        
+        Call after the frame size and quality are set, since changing them
+        restarts the sensor pipeline.
+        """
+        stabilize_ms = int(CAMERA_TIMING['stabilize_delay_s'] * 1000)
+        deadline = time.ticks_add(self._camera_ready_ms, stabilize_ms)
+        self._camera_ready_ms = None
+
+        # The encoded size of a frame tracks its exposure, so auto-exposure
+        # has settled once two consecutive warm-up frames come out about the
+        # same size. Give up at the deadline, the old fixed wait, but always
+        # compare at least one pair: the new settings restarted the pipeline
+        # even if init finished long ago.
+        tolerance = CAMERA_TIMING['converge_tolerance']
+        last_size = None
+        frames = 0
+        while frames < 2 or time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            frame = camera.capture()
+            size = len(frame) if frame else 0
+            frame = None
+            frames += 1
+            if last_size and abs(size - last_size) <= last_size * tolerance:
+                self.logger.debug("Exposure settled (%d byte warm-up frames)", size)
+                return
+            last_size = size
+
+    def _update_firmware(self):
+        """Apply a firmware update, using the manifest from the upload response if there was one."""
+        update, self._firmware_update = self._firmware_update, None
+        self.client.check_and_update_firmware(update)
+
+    def take_photo(self, weather_condition, test_post=False, framesize=None, jpeg_quality=None,
+                   device_status=None, check_firmware=False):
         """
         Capture and upload a photo.
         
         Args:
             weather_condition (str): 'sunny', 'overcast', or 'cloudy'
             test_post (bool): If True, marks upload as test post
+            framesize (str): Frame size name (e.g. 'UXGA'); defaults to CAMERA_CONFIG
+            jpeg_quality (int): JPEG quality 10-63; defaults to CAMERA_CONFIG
+            device_status (dict): Status report to send with the image
+            check_firmware (bool): Ask for the firmware manifest in the upload response
         
         Returns:
             bool: True if successful, False otherwise
@@ -99,26 +332,24 @@ class Program:
             try:
                 weather_condition = validate_weather_condition(weather_condition)
             except ValidationError:
-                self.logger.warn(f"Invalid weather condition '{weather_condition}', using default")
+                self.logger.warn("Invalid weather condition '%s', using default", weather_condition)
                 weather_condition = DEFAULT_WEATHER_CONDITION
             
             self.logger.info("Taking photo...")
-            camera.init(0, format=camera.JPEG, fb_location=camera.PSRAM)
-            time.sleep(CAMERA_TIMING['stabilize_delay_s'])  # Wait for camera to stabilize
+            self._wait_for_camera()  # Wait for camera init
             
             # Apply camera settings from config
             camera.contrast(CAMERA_CONFIG['contrast'])
             camera.saturation(CAMERA_CONFIG['saturation'])
-            camera.framesize(camera.FRAME_QXGA)
+            camera.framesize(getattr(camera, 'FRAME_' + (framesize or CAMERA_CONFIG['framesize'])))
+            camera.quality(jpeg_quality or CAMERA_CONFIG['jpeg_quality'])
             
             # Set white balance based on weather
-            wb_setting = CAMERA_WHITE_BALANCE.get(weather_condition, CAMERA_WHITE_BALANCE['default'])
-            if weather_condition == 'sunny':
-                camera.whitebalance(camera.WB_SUNNY)
-            elif weather_condition in ('cloudy', 'overcast'):
-                camera.whitebalance(camera.WB_CLOUDY)
-            else:
-                camera.whitebalance(camera.WB_NONE)
+            camera.whitebalance(_WHITE_BALANCE.get(weather_condition, _WHITE_BALANCE['default']))
+            
+            # Warm up with the final settings, so the frames that settle
+            # exposure come from the same pipeline as the captured one
+            self._wait_for_exposure()
             
             # Capture frame
             frame = camera.capture()
@@ -127,7 +358,7 @@ class Program:
                 self.state.record_camera_failure()
                 return False
             
-            self.logger.info(f"Captured frame: {len(frame)} bytes")
+            self.logger.info("Captured frame: %s bytes", len(frame))
             self.state.record_camera_success(len(frame))
             
             # Upload
@@ -135,48 +366,165 @@ class Program:
                 response = self.client.upload_image(
                     image_data=frame,
                     test_post=test_post,
+                    status=device_status,
+                    check_firmware=check_firmware,
                 )
-                self.logger.info("Image uploaded successfully")
-                self.state.record_upload_attempt(True)
-                return True
             except Exception as e:
-                self.logger.error(f"Image upload failed: {e}")
+                self.logger.error("Image upload failed: %s", e)
                 self.state.record_upload_attempt(False, str(e))
-                import traceback
-                traceback.print_exc()
+                print_exception(e)
                 return False
+            self.logger.info("Image uploaded successfully")
+            self.state.record_upload_attempt(True)
+
+            # A bad manifest must not turn a delivered image into a failure
+            try:
+                self._firmware_update = self.client.firmware_update_from(response)
+            except Exception as e:
+                self.logger.warn("Ignoring firmware manifest in upload response: %s", e)
+            return True
                 
         except Exception as e:
-            self.logger.error(f"Photo capture failed: {e}")
+            self.logger.error("Photo capture failed: %s", e)
             self.state.record_camera_failure()
-            import traceback
-            traceback.print_exc()
+            print_exception(e)
             return False
         finally:
             try:
                 camera.deinit()
             except Exception as e:
-                self.logger.warn(f"Camera deinit failed: {e}")
+                self.logger.warn("Camera deinit failed: %s", e)
 
-    def fetch_config(self):
-        """Fetch configuration from IoT Manager server."""
+    def _load_rtc_memory(self):
+        """
+        Read the record kept in RTC memory by a previous wake.
+        
+        RTC memory survives deep sleep but is cleared on power loss.
+        
+        Returns:
+            dict: Record with optional 'config_cache', 'ntp_synced_at' and
+                'no_bootstrap' keys; empty if nothing valid was stored
+        """
+        try:
+            raw = self._rtc.memory()
+            if raw:
+                data = json.loads(raw)
+                if isinstance(data, dict):
+                    return data
+        except Exception as e:
+            self.logger.warn("Ignoring unreadable RTC memory: %s", e)
+        return {}
+
+    def _save_rtc_memory(self):
+        """Write the RTC memory record, dropping the config cache if it does not fit."""
+        blob = json.dumps(self._rtc_data).encode()
+        if len(blob) > CONFIG_CACHE['max_bytes'] and 'config_cache' in self._rtc_data:
+            self.logger.warn("Config too large to cache (%s bytes)", len(blob))
+            del self._rtc_data['config_cache']
+            blob = json.dumps(self._rtc_data).encode()
         try:
-            config = self.client.get_config()
-            self.logger.info(f"Configuration fetched: {config}")
+            self._rtc.memory(blob)
+        except Exception as e:
+            self.logger.warn("Failed to write RTC memory: %s", e)
+
+    def _config_cache_record(self):
+        """Return the RTC config cache record, or None if there isn't a usable one."""
+        cache = self._rtc_data.get('config_cache') if CONFIG_CACHE['enabled'] else None
+        if isinstance(cache, dict) and isinstance(cache.get('config'), dict):
+            return cache
+        return None
+
+    def _store_config_cache(self, config, etag=None):
+        """Cache config in RTC memory, or drop the cache if it should not be reused."""
+        if CONFIG_CACHE['enabled'] and config and not config.get('testMode', False):
+            self._rtc_data['config_cache'] = {
+                'config': config,
+                'etag': etag,
+            }
+        elif self._rtc_data.pop('config_cache', None) is None:
+            return
+        self._save_rtc_memory()
+
+    def _reuse_cached_config(self, cache):
+        """
+        Return the cached config for reuse on this wake.
+        
+        nextWakeupTimeMs is an absolute time set for an earlier wake; once it
+        has passed it is dropped, so get_wakeup_time() falls back to the
+        default interval instead of clamping to the minimum and waking
+        again within a minute.
+        
+        Args:
+            cache (dict): Config cache record from RTC memory
+        
+        Returns:
+            dict: Cached config, without a stale nextWakeupTimeMs
+        """
+        config = cache['config']
+        wakeup_time_ms = config.get('nextWakeupTimeMs')
+        if wakeup_time_ms is not None and wakeup_time_ms <= self._unix_time_ms():
+            config = dict(config)
+            del config['nextWakeupTimeMs']
+        return config
+
+    def fetch_config(self, prefetched=None):
+        """
+        Fetch configuration from IoT Manager server.
+        
+        The last good config is kept in RTC memory: its ETag lets the server
+        answer an unchanged config with a bodiless 304, and it stands in if
+        the fetch fails.
+        
+        Args:
+            prefetched (dict): Config already returned by the server (e.g.
+                from bootstrap); validated and cached without another request
+        
+        Returns:
+            dict: Validated config, the last cached config if the fetch
+                fails, or None
+        """
+        cache = self._config_cache_record()
+        try:
+            etag = None
+            if prefetched is not None:
+                config = prefetched
+            else:
+                # Revalidate the cached copy so an unchanged config costs a
+                # 304 with no body
+                config, etag, status = self.client.get_config_if_changed(
+                    etag=cache.get('etag') if cache else None)
+                if status == 304:
+                    self.logger.info("Configuration unchanged")
+                    return self._reuse_cached_config(cache)
+            self.logger.info("Configuration fetched: %s", config)
             
             # Validate server config
             try:
                 validated_config = validate_server_config(config)
-                return validated_config
             except ValidationError as e:
-                self.logger.error(f"Server config validation failed: {e}")
+                self.logger.error("Server config validation failed: %s", e)
                 return None
+            self._store_config_cache(validated_config, etag=etag)
+            return validated_config
                 
         except Exception as e:
-            self.logger.error(f"Fetch config failed: {e}")
+            self.logger.error("Fetch config failed: %s", e)
             self.state.record_error(str(e), 'config_fetch')
+            if cache:
+                self.logger.warn("Falling back to cached configuration")
+                return self._reuse_cached_config(cache)
             return None
 
+    def _unix_time_ms(self):
+        """
+        Return the current time as a Unix timestamp in milliseconds.
+        
+        ESP32 time.time() returns seconds since Jan 1, 2000; the server
+        works in ms since Jan 1, 1970. Kept in int arithmetic so timestamps
+        stay exact on ports where time.time() returns a float.
+        """
+        return self._esp32_offset_ms + int(time.time()) * 1000
+
     def get_wakeup_time(self, config):
         """
         Calculate milliseconds until next scheduled wakeup.
@@ -187,46 +535,29 @@ class Program:
         Returns:
             int: Milliseconds to sleep (validated to reasonable range)
         """
-        # Get config values
-        default_ms = WAKEUP_CONFIG['default_interval_ms']
-        min_ms = WAKEUP_CONFIG['min_interval_ms']
-        max_ms = WAKEUP_CONFIG['max_interval_ms']
-        esp32_offset = WAKEUP_CONFIG['esp32_epoch_offset']
-        
-        wakeup_time_ms = None
-        
-        # Try to get wakeup time from config with null safety
+        # Common case first: the server supplied a wakeup time. A missing
+        # config or key, or a None value, falls through to the default.
         try:
-            if config and isinstance(config, dict):
-                wakeup_time_ms = config.get('nextWakeupTimeMs')
-                if wakeup_time_ms:
-                    self.logger.info(f"Next wakeup time from server: {wakeup_time_ms}")
-        except Exception as e:
-            self.logger.warn(f"Error reading wakeup time from config: {e}")
-        
-        # If no valid wakeup time from server, use default
-        if wakeup_time_ms is None:
-            self.logger.info(f"Using default wakeup interval: {default_ms}ms ({default_ms / 1000 / 60 / 60:.0f} hours)")
+            wakeup_time_ms = config['nextWakeupTimeMs']
+            ms_til_next_wakeup = wakeup_time_ms - self._unix_time_ms()
+        except (KeyError, TypeError):
+            default_ms = self._default_ms
+            self.logger.info("Using default wakeup interval: %sms (%.0f hours)", default_ms, default_ms / _MS_PER_HOUR)
             return default_ms
         
-        # Calculate how long until that time
-        # ESP32 time.time() returns seconds since Jan 1, 2000
-        # Convert to Unix timestamp (ms since Jan 1, 1970) for comparison with server
-        current_unix_timestamp_ms = (esp32_offset + time.time()) * 1000
-        ms_til_next_wakeup = wakeup_time_ms - current_unix_timestamp_ms
-        
-        self.logger.debug(f"Current timestamp (Unix ms): {current_unix_timestamp_ms}")
-        self.logger.debug(f"Wakeup time (Unix ms): {wakeup_time_ms}")
-        self.logger.info(f"Time until wakeup: {ms_til_next_wakeup}ms ({ms_til_next_wakeup / 1000 / 60:.0f} minutes)")
+        # __debug__ is False in optimised builds, which drop this block entirely
+        if __debug__ and self.logger.is_enabled_for(self.logger.DEBUG):
+            self.logger.debug("Wakeup time (Unix ms): %s", wakeup_time_ms)
+        self.logger.info("Time until wakeup: %sms (%.0f minutes)", ms_til_next_wakeup, ms_til_next_wakeup / _MS_PER_MINUTE)
         
         # Validate sleep time is in reasonable range
-        if ms_til_next_wakeup < min_ms:
-            self.logger.warn(f"Wakeup time in past or too soon. Using minimum: {min_ms}ms (1 minute)")
-            return min_ms
+        if ms_til_next_wakeup < self._min_ms:
+            self.logger.warn("Wakeup time in past or too soon. Using minimum: %sms (1 minute)", self._min_ms)
+            return self._min_ms
         
-        if ms_til_next_wakeup > max_ms:
-            self.logger.warn(f"Wakeup time too far away. Capping to maximum: {max_ms}ms (48 hours)")
-            return max_ms
+        if ms_til_next_wakeup > self._max_ms:
+            self.logger.warn("Wakeup time too far away. Capping to maximum: %sms (48 hours)", self._max_ms)
+            return self._max_ms
         
         return ms_til_next_wakeup
 
@@ -235,76 +566,124 @@ class Program:
         self.logger.info("Starting Program main function")
         wakeup_time = time.time()
         wake_reason = machine.wake_reason()
-        self.logger.info(f"Wake reason: {wake_reason} at time: {wakeup_time}")
-        timer_based_wakeup = (wake_reason == 4)
-        allow_captive_portal = not timer_based_wakeup
+        self.logger.info("Wake reason: %s at time: %s", wake_reason, wakeup_time)
+        timer_based_wakeup = (wake_reason == _WAKE_TIMER)
+        # A timer wake normally skips the portal, unless no network has been
+        # saved yet: then there is nothing to connect to without it
+        allow_captive_portal = not timer_based_wakeup or not get_profiles()
+        self.start_camera()
         wlan = self.connect_wifi(enter_captive_portal_if_needed=allow_captive_portal)
         
         if wlan is None:
             self.logger.error("Failed to connect to WiFi")
             raise Exception("WiFi connection failed")
         
-        self.logger.info(f"Connected to wifi. The time is now: {time.time()}")
-        self.client.authenticate(self.device_id, self.device_password)
-        self.client.discover()
-        self.logger.info(f"Connected to IoT Manager at: {self.iot_manager_base_url}")
+        self.logger.info("Connected to wifi. The time is now: %s", time.time())
+        # RTC memory remembers a server without /bootstrap, so later wakes
+        # skip the failing request; a power cycle tries it again
+        no_bootstrap = self._rtc_data.get('no_bootstrap', False)
+        server_config = self.client.bootstrap(self.device_id, self.device_password,
+                                              try_bootstrap=not no_bootstrap)
+        self.logger.info("Connected to IoT Manager at: %s", self.iot_manager_base_url)
+        # The config cache and wakeup maths below need the synced clock
+        self._wait_for_time_sync()
+        # Only touch the RTC record once the NTP worker, which also saves
+        # it, has finished
+        if self.client.bootstrap_supported is False and not no_bootstrap:
+            self._rtc_data['no_bootstrap'] = True
+            self._save_rtc_memory()
         
         config = None
         try:
-            config = self.fetch_config()
-            self.logger.info(f"Configuration: {config}")
+            config = self.fetch_config(prefetched=server_config)
+            self.logger.info("Configuration: %s", config)
         except Exception as e:
-            self.logger.warn(f"Fetch config failed: {e}")
+            self.logger.warn("Fetch config failed: %s", e)
 
         # Set defaults
         in_test_mode = False
         weather_condition = DEFAULT_WEATHER_CONDITION
+        framesize = None
+        jpeg_quality = None
         
         # Override with server config if available
         try:
             if config and isinstance(config, dict):
                 in_test_mode = config.get('testMode', False)
+                framesize = config.get('frameSize')
+                jpeg_quality = config.get('jpegQuality')
                 server_weather = config.get('weatherCondition', DEFAULT_WEATHER_CONDITION)
                 try:
                     weather_condition = validate_weather_condition(server_weather)
                 except ValidationError:
-                    self.logger.warn(f"Invalid weather condition '{server_weather}' from server, using default")
+                    self.logger.warn("Invalid weather condition '%s' from server, using default", server_weather)
                     weather_condition = DEFAULT_WEATHER_CONDITION
         except Exception as e:
-            self.logger.warn(f"Failed to read config: {e}")
+            self.logger.warn("Failed to read config: %s", e)
         
-        image_send_successful = None
-
-        upload_test_image = in_test_mode or not timer_based_wakeup
-        image_send_successful = self.take_photo(
-            weather_condition=weather_condition,
-            test_post=upload_test_image
-        )   
-
-        ms_til_next_wakeup = WAKEUP_CONFIG['test_mode_interval_ms']
+        ms_til_next_wakeup = self._test_ms
         if not in_test_mode:
             ms_til_next_wakeup = self.get_wakeup_time(config)
 
+        # The status rides along with the image upload; it describes a
+        # successful send and is only posted separately if the upload fails
         signal_strength = self.wifi_manager.get_signal_strength()
         device_status = {
             "signal_strength": signal_strength,
             "firmware_version": self.client.get_firmware_version(),
-            "image_send_successful": image_send_successful,
+            "image_send_successful": True,
             "wake_reason": wake_reason,
             "running_in_test_mode": in_test_mode,
             "sleep_for": ms_til_next_wakeup,
             "weather_condition": weather_condition,
             "device_state": self.state.get_status(),
         }
-        self.logger.info(f'Reporting device status: {device_status}')
-        self.client.create_device_status(device_status)
+        self.logger.info('Reporting device status: %s', device_status)
+
+        upload_test_image = in_test_mode or not timer_based_wakeup
+        image_send_successful = self.take_photo(
+            weather_condition=weather_condition,
+            test_post=upload_test_image,
+            framesize=framesize,
+            jpeg_quality=jpeg_quality,
+            device_status=device_status,
+            check_firmware=not in_test_mode,
+        )
+
+        if not image_send_successful:
+            device_status["image_send_successful"] = image_send_successful
+            device_status["device_state"] = self.state.get_status()
+            response = self.client.create_device_status(device_status, check_firmware=not in_test_mode)
+            self._firmware_update = self.client.firmware_update_from(response)
 
         if not in_test_mode:
             try:
                 self.logger.info("Checking for firmware updates...")
-                self.client.check_and_update_firmware()
+                if self._firmware_update is None:
+                    # The server sent no manifest; ask on the open connection
+                    self._firmware_update = self.client.check_for_firmware_update()
             except Exception as e:
-                self.logger.error(f"Firmware update check failed: {e}")
+                self.logger.error("Firmware update check failed: %s", e)
+        # Free the kept-alive TLS session before the OTA download needs the heap
+        self.client.close()
 
-        self.logger.info(f"Entering deep sleep for {ms_til_next_wakeup / 1000 / 60:.0f} minutes")
+        # (None, None) means the check ran and found nothing newer
+        if self._firmware_update and self._firmware_update[0]:
+            # A successful update resets the device, so persist this cycle's
+            # state and log lines first; the logger reopens its file if the
+            # update fails and more is logged
+            self.state.flush(force=True)
+            self.logger.close()
+            try:
+                self._update_firmware()
+            except Exception as e:
+                self.logger.error("Firmware update failed: %s", e)
+
+        if not in_test_mode:
+            # Capture, upload and any update took seconds since the estimate
+            # reported in the status; aim at the server's wakeup time itself
+            ms_til_next_wakeup = self.get_wakeup_time(config)
+        self.logger.info("Entering deep sleep for %.0f minutes", ms_til_next_wakeup / _MS_PER_MINUTE)
+        self.state.flush(force=True)
+        self.logger.close()
         machine.deepsleep(ms_til_next_wakeup)
\ No newline at end of file
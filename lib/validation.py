@@ -5,7 +5,6 @@ This module provides functions to validate configuration, parameters,
 and data received from external sources.
 """
 
-import re
 from lib.config import (
     VALID_WEATHER_CONDITIONS,
     CAMERA_CONFIG,
@@ -13,6 +12,30 @@ from lib.config import (
 )
 
 
+# Byte -> 1 if allowed in a device ID ([a-zA-Z0-9_-]), else 0
+_DEVICE_ID_OK = bytes(
+    1 if (48 <= c <= 57 or 65 <= c <= 90 or 97 <= c <= 122 or c in (45, 95)) else 0
+    for c in range(256)
+)
+
+# Supported camera frame sizes, largest first (order is kept for messages)
+_FRAMESIZE_NAMES = (
+    'QXGA',    # 2048x1536
+    'UXGA',    # 1600x1200
+    'SXGA',    # 1280x1024
+    'XGA',     # 1024x768
+    'SVGA',    # 800x600
+    'VGA',     # 640x480
+    'CIF',     # 352x288
+    'QVGA',    # 320x240
+    'HQVGA',   # 240x176
+)
+_VALID_FRAMESIZES = set(_FRAMESIZE_NAMES)
+
+# Hash lookup for weather conditions; the config list keeps message order
+_VALID_WEATHER = set(VALID_WEATHER_CONDITIONS)
+
+
 class ValidationError(Exception):
     """Raised when validation fails."""
     pass
@@ -38,7 +61,9 @@ def validate_url(url):
     if not isinstance(url, str):
         raise ValidationError("URL must be string, got {}".format(type(url)))
     
-    if not url.strip():
+    # strip() returns the same object when there is nothing to remove
+    stripped = url.strip()
+    if not stripped:
         raise ValidationError("URL cannot be empty")
     
     if not (url.startswith('http://') or url.startswith('https://')):
@@ -48,7 +73,7 @@ def validate_url(url):
     if len(url) < 10:
         raise ValidationError("URL is too short")
     
-    return url.strip()
+    return stripped
 
 
 # ============================================================================
@@ -71,13 +96,12 @@ def validate_device_id(device_id):
     if not isinstance(device_id, str):
         raise ValidationError("Device ID must be string, got {}".format(type(device_id)))
     
-    if not device_id.strip():
-        raise ValidationError("Device ID cannot be empty")
-    
     device_id = device_id.strip()
+    if not device_id:
+        raise ValidationError("Device ID cannot be empty")
     
     # Allow alphanumeric, dash, underscore
-    if not re.match(r'^[a-zA-Z0-9_-]+$', device_id):
+    if any(not _DEVICE_ID_OK[c] for c in device_id.encode()):
         raise ValidationError("Device ID contains invalid characters: {}".format(device_id))
     
     if len(device_id) > 64:
@@ -136,7 +160,7 @@ def validate_weather_condition(condition):
     
     condition = condition.strip().lower()
     
-    if condition not in VALID_WEATHER_CONDITIONS:
+    if condition not in _VALID_WEATHER:
         valid_str = ', '.join(VALID_WEATHER_CONDITIONS)
         raise ValidationError(
             "Weather condition '{}' is invalid. Must be one of: {}".format(
@@ -164,25 +188,13 @@ def validate_framesize(framesize):
     Raises:
         ValidationError: If framesize is invalid
     """
-    valid_sizes = [
-        'QXGA',    # 2048x1536
-        'UXGA',    # 1600x1200
-        'SXGA',    # 1280x1024
-        'XGA',     # 1024x768
-        'SVGA',    # 800x600
-        'VGA',     # 640x480
-        'CIF',     # 352x288
-        'QVGA',    # 320x240
-        'HQVGA',   # 240x176
-    ]
-    
     if not isinstance(framesize, str):
         raise ValidationError("Framesize must be string, got {}".format(type(framesize)))
     
     framesize = framesize.strip().upper()
     
-    if framesize not in valid_sizes:
-        valid_str = ', '.join(valid_sizes)
+    if framesize not in _VALID_FRAMESIZES:
+        valid_str = ', '.join(_FRAMESIZE_NAMES)
         raise ValidationError(
             "Framesize '{}' is invalid. Must be one of: {}".format(
                 framesize, valid_str
@@ -236,6 +248,28 @@ def validate_saturation(saturation):
     return saturation
 
 
+def validate_jpeg_quality(quality):
+    """
+    Validate camera JPEG quality setting.
+    
+    Args:
+        quality (int): JPEG quality (10 to 63, lower is better quality)
+    
+    Returns:
+        int: The validated quality
+    
+    Raises:
+        ValidationError: If quality is invalid
+    """
+    if not isinstance(quality, int):
+        raise ValidationError("JPEG quality must be integer, got {}".format(type(quality)))
+    
+    if quality < 10 or quality > 63:
+        raise ValidationError("JPEG quality must be between 10 and 63, got {}".format(quality))
+    
+    return quality
+
+
 # ============================================================================
 # WAKEUP TIME VALIDATION
 # ============================================================================
@@ -282,10 +316,38 @@ def validate_wakeup_time_ms(wakeup_time_ms):
 # CONFIGURATION VALIDATION
 # ============================================================================
 
+def _validate_test_mode(test_mode):
+    if not isinstance(test_mode, bool):
+        raise ValidationError("must be boolean, got {}".format(type(test_mode)))
+    return test_mode
+
+
+def _validate_next_wakeup_ms(wakeup_ms):
+    if not isinstance(wakeup_ms, int):
+        raise ValidationError("must be integer, got {}".format(type(wakeup_ms)))
+    if wakeup_ms <= 0:
+        raise ValidationError("must be positive, got {}".format(wakeup_ms))
+    return wakeup_ms
+
+
+# Server config key -> validator; keys not listed are passed through
+_SERVER_CONFIG_VALIDATORS = {
+    'testMode': _validate_test_mode,
+    'weatherCondition': validate_weather_condition,
+    'nextWakeupTimeMs': _validate_next_wakeup_ms,
+    'frameSize': validate_framesize,
+    'jpegQuality': validate_jpeg_quality,
+}
+
+
 def validate_server_config(config):
     """
     Validate configuration received from server.
     
+    Known keys (testMode, weatherCondition, nextWakeupTimeMs, frameSize,
+    jpegQuality) are validated; any other fields are preserved unchanged
+    for forward compatibility.
+    
     Args:
         config (dict): Configuration dictionary from server
     
@@ -298,41 +360,17 @@ def validate_server_config(config):
     if not isinstance(config, dict):
         raise ValidationError("Config must be dict, got {}".format(type(config)))
     
+    validators = _SERVER_CONFIG_VALIDATORS
     validated = {}
-    
-    # Validate testMode (optional boolean)
-    if 'testMode' in config:
-        test_mode = config['testMode']
-        if not isinstance(test_mode, bool):
-            raise ValidationError("testMode must be boolean, got {}".format(type(test_mode)))
-        validated['testMode'] = test_mode
-    
-    # Validate weatherCondition (optional string)
-    if 'weatherCondition' in config:
-        try:
-            validated['weatherCondition'] = validate_weather_condition(
-                config['weatherCondition']
-            )
-        except ValidationError as e:
-            raise ValidationError("Invalid weatherCondition: {}".format(e))
-    
-    # Validate nextWakeupTimeMs (optional integer)
-    if 'nextWakeupTimeMs' in config:
-        wakeup_ms = config['nextWakeupTimeMs']
-        if not isinstance(wakeup_ms, int):
-            raise ValidationError(
-                "nextWakeupTimeMs must be integer, got {}".format(type(wakeup_ms))
-            )
-        if wakeup_ms <= 0:
-            raise ValidationError(
-                "nextWakeupTimeMs must be positive, got {}".format(wakeup_ms)
-            )
-        validated['nextWakeupTimeMs'] = wakeup_ms
-    
-    # Preserve any other unknown fields for forward compatibility
     for key, value in config.items():
-        if key not in validated:
+        validator = validators.get(key)
+        if validator is None:
             validated[key] = value
+            continue
+        try:
+            validated[key] = validator(value)
+        except ValidationError as e:
+            raise ValidationError("Invalid {}: {}".format(key, e))
     
     return validated
 
@@ -341,6 +379,17 @@ def validate_server_config(config):
 # HELPER FUNCTIONS
 # ============================================================================
 
+def _safe_get(obj, key, typ, default):
+    """Return obj[key] if obj is a dict and the value is exactly of type typ, else default."""
+    if type(obj) is not dict:
+        return default
+    try:
+        value = obj[key]
+    except (KeyError, TypeError):
+        return default
+    return value if type(value) is typ else default
+
+
 def safe_get_bool(obj, key, default=False):
     """
     Safely get a boolean value from a dict.
@@ -353,15 +402,7 @@ def safe_get_bool(obj, key, default=False):
     Returns:
         bool: The value, or default if not found
     """
-    if not isinstance(obj, dict):
-        return default
-    
-    value = obj.get(key, default)
-    
-    if isinstance(value, bool):
-        return value
-    
-    return default
+    return _safe_get(obj, key, bool, default)
 
 
 def safe_get_int(obj, key, default=0):
@@ -374,17 +415,9 @@ def safe_get_int(obj, key, default=0):
         default (int): Default value if key not present
     
     Returns:
-        int: The value, or default if not found
+        int: The value, or default if not found (booleans are not ints here)
     """
-    if not isinstance(obj, dict):
-        return default
-    
-    value = obj.get(key, default)
-    
-    if isinstance(value, int):
-        return value
-    
-    return default
+    return _safe_get(obj, key, int, default)
 
 
 def safe_get_string(obj, key, default=''):
@@ -399,12 +432,4 @@ def safe_get_string(obj, key, default=''):
     Returns:
         str: The value, or default if not found
     """
-    if not isinstance(obj, dict):
-        return default
-    
-    value = obj.get(key, default)
-    
-    if isinstance(value, str):
-        return value
-    
-    return default
+    return _safe_get(obj, key, str, default)
@@ -11,8 +11,9 @@ def _html_escape(value):
     )
 
 
-def iter_root_html(ssids):
-    yield """\
+# The page is kept as module-level bytes constants, so each request
+# sends them as-is instead of building or encoding strings.
+_PAGE_HEAD = b"""\
             <html>
                 <head>
                     <meta name=\"viewport\" content=\"initial-scale=1.0, width=device-width\">
@@ -33,26 +34,18 @@ def iter_root_html(ssids):
                         <tbody>
         """
 
-    for ssid in ssids or []:
-        esc_ssid = _html_escape(ssid)
-        # Keep the markup aligned with the original streaming approach.
-        yield (
-            """\
+_ROW_START = b"""\
                             <tr>
                                 <td colspan=\"2\">
                                     <input type=\"radio\" name=\"ssid\" value=\""""
-            + esc_ssid
-            + """\" /><label for=\""""
-            + esc_ssid
-            + """\">"""
-            + esc_ssid
-            + """</label>
+_ROW_LABEL_FOR = b"""\" /><label for=\""""
+_ROW_LABEL = b"""\">"""
+_ROW_END = b"""</label>
                                 </td>
                             </tr>
             """
-        )
 
-    yield """\
+_PAGE_FOOT = b"""\
                             <tr>
                                 <td><label for=\"password\">Password:</label></td>
                                 <td><input name=\"password\" type=\"password\" /></td>
@@ -68,5 +61,34 @@ def iter_root_html(ssids):
         """
 
 
+def iter_root_html(ssids):
+    """Yield the portal page as bytes chunks.
+
+    ssids may be a list or a zero-argument callable returning one. A
+    callable is only invoked after the page head has been yielded, so a
+    slow WiFi scan doesn't hold up the first bytes of the response.
+    """
+    yield _PAGE_HEAD
+
+    if callable(ssids):
+        ssids = ssids()
+
+    # All rows go out as one chunk (one sendall) rather than one per SSID
+    rows = bytearray()
+    for ssid in ssids or []:
+        esc_ssid = _html_escape(ssid).encode()
+        rows += _ROW_START
+        rows += esc_ssid
+        rows += _ROW_LABEL_FOR
+        rows += esc_ssid
+        rows += _ROW_LABEL
+        rows += esc_ssid
+        rows += _ROW_END
+    if rows:
+        yield rows
+
+    yield _PAGE_FOOT
+
+
 def render_root_html(ssids):
-    return "".join(iter_root_html(ssids))
+    return b"".join(iter_root_html(ssids)).decode()
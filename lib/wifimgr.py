@@ -1,6 +1,6 @@
 import network
 import socket
-import ure
+import uselect
 from machine import Timer
 import time
 import errno
@@ -12,6 +12,44 @@ NETWORK_PROFILES = 'wifi.dat'
 wlan_ap = network.WLAN(network.AP_IF)
 wlan_sta = network.WLAN(network.STA_IF)
 
+# Captive portal page loads reuse a scan this recent; ?rescan=1 forces a new one
+SCAN_CACHE_MS = 30 * 1000
+_scan_cache = [0, None]  # [ticks_ms of last scan, sorted unique SSIDs]
+
+# How often the portal loop wakes to check the STA link while no client is waiting
+PORTAL_POLL_MS = 100
+# ...and how often while no station is associated with the portal AP
+PORTAL_IDLE_POLL_MS = 1000
+
+# Sort key for scan results by RSSI; operator isn't in every firmware build
+try:
+    from operator import itemgetter
+    _by_rssi = itemgetter(3)
+except ImportError:
+    def _by_rssi(network):
+        return network[3]
+
+# Saved profiles, read from NETWORK_PROFILES on first use
+_profiles_cache = [None]
+
+# STA states that mean the current connect attempt has definitely failed
+_CONNECT_FAILED = set(
+    getattr(network, name) for name in ('STAT_WRONG_PASSWORD', 'STAT_NO_AP_FOUND', 'STAT_ASSOC_FAIL')
+    if hasattr(network, name)
+)
+
+# Connectivity checks from Android, Apple and Windows; answered with a bare
+# redirect (which also makes the OS pop up the portal) instead of the page
+_PROBE_PATHS = set((b"generate_204", b"gen_204", b"hotspot-detect.html", b"success.html",
+                    b"success.txt", b"ncsi.txt", b"connecttest.txt"))
+PORTAL_URL = "http://192.168.4.1/"
+
+# Portal requests are read into one preallocated buffer of this size
+REQUEST_BUFFER_SIZE = 2048
+
+# Not every port exposes TCP_NODELAY; None disables the setsockopt call
+_TCP_NODELAY = (getattr(socket, 'IPPROTO_TCP', None), getattr(socket, 'TCP_NODELAY', None))
+
 
 class CaptiveNetworkTimeoutException(Exception):
     pass
@@ -24,41 +62,50 @@ class WifiManager:
         self.password = password
         self.authmode = authmode
         self.server_socket = None
+        self._last_rssi = None
+
+    def _connected(self):
+        # Remember the association RSSI so status reports needn't query again
+        self._last_rssi = wlan_sta.status('rssi')
+        return wlan_sta
 
     def get_connection(self, enter_captive_portal_if_needed=True):
         """return a working WLAN(STA_IF) instance or None"""
 
         # First check if there already is any connection:
         if wlan_sta.isconnected():
-            return wlan_sta
+            return self._connected()
 
         connected = False
         try:
-            # ESP connecting to WiFi takes time, wait a bit and try again:
-            time.sleep(3)
-            if wlan_sta.isconnected():
-                return wlan_sta
+            # A connection can only be in progress if the interface is already
+            # up; give it up to 3 s to come through, otherwise don't wait at all
+            if wlan_sta.active():
+                for retry in range(30):
+                    time.sleep(0.1)
+                    if wlan_sta.isconnected():
+                        return self._connected()
 
             # Read known network profiles from file
-            profiles = read_profiles()
+            profiles = get_profiles()
 
             # Search WiFis in range
             wlan_sta.active(True)
             networks = wlan_sta.scan()
 
             AUTHMODE = {0: "open", 1: "WEP", 2: "WPA-PSK", 3: "WPA2-PSK", 4: "WPA/WPA2-PSK"}
-            for ssid, bssid, channel, rssi, authmode, hidden in sorted(networks, key=lambda x: x[3], reverse=True):
+            for ssid, bssid, channel, rssi, authmode, hidden in sorted(networks, key=_by_rssi, reverse=True):
                 ssid = ssid.decode('utf-8')
                 encrypted = authmode > 0
                 print("ssid: %s chan: %d rssi: %d authmode: %s" % (ssid, channel, rssi, AUTHMODE.get(authmode, '?')))
                 if encrypted:
                     if ssid in profiles:
                         password = profiles[ssid]
-                        connected = do_connect(ssid, password)
+                        connected = do_connect(ssid, password, bssid)
                     else:
                         print("skipping unknown encrypted network")
                 else:  # open
-                    connected = do_connect(ssid, None)
+                    connected = do_connect(ssid, None, bssid)
                 if connected:
                     break
 
@@ -69,7 +116,7 @@ class WifiManager:
         if not connected and enter_captive_portal_if_needed:
             connected = self.start()
 
-        return wlan_sta if connected else None
+        return self._connected() if connected else None
 
 
     def stop(self):
@@ -91,9 +138,20 @@ class WifiManager:
         self.server_socket = socket.socket()
         self.server_socket.bind(addr)
         self.server_socket.listen(1)
+        # Poll instead of blocking in accept() so a successful STA connection
+        # is noticed even when no browser is talking to the portal
+        self.server_socket.setblocking(False)
+        poller = uselect.poll()
+        poller.register(self.server_socket, uselect.POLLIN)
 
         mdns = MicroDNSSrv.Create({ '*' : '192.168.4.1' })
 
+        # Scan now so the first page load is served from the cache
+        try:
+            get_ssids(force=True)
+        except OSError as e:
+            print("Initial WiFi scan failed:", e)
+
         print("Running captive portal... for 5 minutes")
         print('Connect to WiFi ssid ' + self.ssid + ', default password: ' + self.password)
         print('and open browser window (captive portal should redirect)')
@@ -108,59 +166,62 @@ class WifiManager:
         
         timer_length = 5 * 60 * 1000  # 5 minutes
         timer = Timer(0, period=timer_length, mode=Timer.ONE_SHOT, callback=times_up)
+        request_buf = memoryview(bytearray(REQUEST_BUFFER_SIZE))
         while True:
             if wlan_sta.isconnected():
-                # Allow confirmation page to display before shutting down network
+                # The confirmation page went out with Connection: close and
+                # TCP_NODELAY; a short pause lets the final segments drain
                 timer.deinit()
-                time.sleep(3)
+                time.sleep_ms(200)
                 mdns.Stop()
                 self.stop()
                 wlan_ap.active(False)
                 return True
 
-            client, addr = self.server_socket.accept()
+            if not poller.poll(PORTAL_POLL_MS if has_stations() else PORTAL_IDLE_POLL_MS):
+                continue
+            try:
+                client, addr = self.server_socket.accept()
+            except OSError as e:
+                if e.args[0] == errno.EAGAIN:
+                    continue
+                raise
             print('client connected from', addr)
             try:
                 client.settimeout(5.0)
+                if None not in _TCP_NODELAY:
+                    try:
+                        client.setsockopt(_TCP_NODELAY[0], _TCP_NODELAY[1], 1)
+                    except OSError:
+                        pass
 
-                request = b""
-                try:
-                    while "\r\n\r\n" not in request:
-                        request += client.recv(512)
-                except OSError:
-                    pass
-
-                # Handle form data from Safari on macOS and iOS; it sends \r\n\r\nssid=<ssid>&password=<password>
-                try:
-                    request += client.recv(1024)
-                    print("Received form data after \\r\\n\\r\\n(i.e. from Safari on macOS or iOS)")
-                except OSError:
-                    pass
+                request = read_request(client, request_buf)
 
                 print("Request is: {}".format(request))
                 if "HTTP" not in request:  # skip invalid requests
                     continue
 
-                # version 1.9 compatibility
-                try:
-                    url = ure.search("(?:GET|POST) /(.*?)(?:\\?.*?)? HTTP", request).group(1).decode("utf-8").rstrip("/")
-                except Exception:
-                    url = ure.search("(?:GET|POST) /(.*?)(?:\\?.*?)? HTTP", request).group(1).rstrip("/")
+                url, query = parse_request_line(request)
                 print("URL is {}".format(url))
 
 
-                # TODO getting "generate_204 as address"
-                if url == "configure":
+                if url.rsplit(b"/", 1)[-1] in _PROBE_PATHS:
+                    send_redirect(client)
+                elif url == b"configure":
                     handle_configure(client, request)
                 else:
-                    handle_root(client)
+                    handle_root(client, rescan=b"rescan=1" in query)
 
             finally:
                 client.close()
 
-    def get_signal_strength(self):
+    def get_signal_strength(self, fresh=False):
+        """Return the RSSI measured at connection time, or a new reading if fresh."""
+        if not fresh and self._last_rssi is not None:
+            return self._last_rssi
         if wlan_sta.isconnected():
-            return wlan_sta.status('rssi')
+            self._last_rssi = wlan_sta.status('rssi')
+            return self._last_rssi
         return None
 
 
@@ -169,20 +230,21 @@ def read_profiles():
     """Read WiFi profiles from storage. Returns empty dict if file doesn't exist."""
     try:
         with open(NETWORK_PROFILES) as f:
-            lines = f.readlines()
-        profiles = {}
-        for line in lines:
-            if line.strip():  # Skip empty lines
-                try:
-                    ssid, password = line.strip("\n").split(";", 1)  # Use split with max=1
-                    profiles[ssid] = password
-                except ValueError:
-                    print(f"Warning: Skipping malformed wifi.dat line: {line}")
-        return profiles
+            data = f.read()
     except OSError:
         # File doesn't exist yet (first boot) - return empty profiles
         print("Note: wifi.dat not found. Device will scan for networks.")
         return {}
+    profiles = {}
+    for line in data.split("\n"):
+        if not line.strip():  # Skip empty lines
+            continue
+        fields = line.split(";", 1)  # Passwords may contain ';'
+        if len(fields) == 2:
+            profiles[fields[0]] = fields[1]
+        else:
+            print(f"Warning: Skipping malformed wifi.dat line: {line}")
+    return profiles
 
 
 
@@ -194,16 +256,48 @@ def write_profiles(profiles):
         f.write(''.join(lines))
 
 
-def do_connect(ssid, password):
+def get_profiles():
+    """Return the saved WiFi profiles, reading wifi.dat only on first use."""
+    if _profiles_cache[0] is None:
+        _profiles_cache[0] = read_profiles()
+    return _profiles_cache[0]
+
+
+def save_profile(ssid, password):
+    """Store a WiFi profile, touching wifi.dat only when something changed.
+
+    A new SSID is appended as one line; only a changed password for a known
+    SSID rewrites the whole file.
+    """
+    profiles = get_profiles()
+    if ssid in profiles:
+        if profiles[ssid] == password:
+            return
+        profiles[ssid] = password
+        write_profiles(profiles)
+    else:
+        profiles[ssid] = password
+        with open(NETWORK_PROFILES, "a") as f:
+            f.write("%s;%s\n" % (ssid, password))
+
+
+def do_connect(ssid, password, bssid=None):
     wlan_sta.active(True)
     if wlan_sta.isconnected():
         return None
     print('Trying to connect to %s...' % ssid)
-    wlan_sta.connect(ssid, password)
+    if bssid is None:
+        wlan_sta.connect(ssid, password)
+    else:
+        # Pinning the BSSID from our own scan saves the driver another scan
+        wlan_sta.connect(ssid, password, bssid=bssid)
     for retry in range(200):
         connected = wlan_sta.isconnected()
         if connected:
             break
+        if wlan_sta.status() in _CONNECT_FAILED:
+            # Retrying can't fix a wrong password or a missing AP
+            break
         time.sleep(0.1)
         print('.', end='')
     if connected:
@@ -213,12 +307,79 @@ def do_connect(ssid, password):
     return connected
 
 
+def _content_length(head):
+    """Return the Content-Length in a request's header block, or 0."""
+    for line in head.split(b"\r\n")[1:]:
+        name_value = line.split(b":", 1)
+        if len(name_value) == 2 and name_value[0].strip().lower() == b"content-length":
+            try:
+                return int(name_value[1])
+            except ValueError:
+                return 0
+    return 0
+
+
+def read_request(client, buf):
+    """Read an HTTP request into a preallocated buffer.
+
+    Reads until the end of the headers. Only the newly read bytes (plus the
+    three before them) are searched for the blank line. A POST then keeps
+    reading until its Content-Length is covered; Safari sends the form
+    data in a separate segment. Other requests have no body and return
+    straight away rather than waiting out the socket timeout.
+
+    Args:
+        client (socket): Accepted client socket
+        buf (memoryview): Buffer to read into; the request is truncated at its size
+
+    Returns:
+        bytes: The request as received
+    """
+    size = len(buf)
+    end = 0
+    try:
+        while end < size:
+            n = client.readinto(buf[end:end + 512])
+            if not n:
+                break
+            found = b"\r\n\r\n" in bytes(buf[max(0, end - 3):end + n])
+            end += n
+            if found:
+                break
+    except OSError:
+        return bytes(buf[:end])
+
+    request = bytes(buf[:end])
+    if not request.startswith(b"POST"):
+        return request
+    head_end = request.find(b"\r\n\r\n")
+    if head_end < 0:
+        return request
+    wanted = min(head_end + 4 + _content_length(request[:head_end]), size)
+    if end >= wanted:
+        return request
+    try:
+        while end < wanted:
+            n = client.readinto(buf[end:wanted])
+            if not n:
+                break
+            end += n
+    except OSError:
+        pass
+    return bytes(buf[:end])
+
+
 def send_header(client, status_code=200, content_length=None ):
-    client.sendall("HTTP/1.0 {} OK\r\n".format(status_code))
-    client.sendall("Content-Type: text/html\r\n")
+    # One write for the whole header block rather than one per line
+    header = "HTTP/1.0 {} OK\r\nContent-Type: text/html\r\nConnection: close\r\n".format(status_code)
     if content_length is not None:
-        client.sendall("Content-Length: {}\r\n".format(content_length))
-    client.sendall("\r\n")
+        header += "Content-Length: {}\r\n".format(content_length)
+    client.sendall(header + "\r\n")
+
+
+def send_redirect(client, location=PORTAL_URL):
+    client.sendall("HTTP/1.0 302 Found\r\nLocation: {}\r\nContent-Length: 0\r\n"
+                   "Connection: close\r\n\r\n".format(location))
 
 
 def send_response(client, payload, status_code=200):
@@ -229,12 +390,37 @@ def send_response(client, payload, status_code=200):
     client.close()
 
 
-def handle_root(client):
+def has_stations():
+    """Return True if any station is associated with the portal AP."""
     try:
+        return bool(wlan_ap.status('stations'))
+    except (OSError, ValueError):
+        # Not reported on this port; assume someone may be connecting
+        return True
+
+
+def get_ssids(force=False):
+    """Return sorted unique SSIDs in range, rescanning at most every SCAN_CACHE_MS."""
+    scanned_at, ssids = _scan_cache
+    if force or ssids is None or time.ticks_diff(time.ticks_ms(), scanned_at) >= SCAN_CACHE_MS:
         wlan_sta.active(True)
-        ssids = sorted(ssid.decode('utf-8') for ssid, *_ in wlan_sta.scan())
+        # Networks with several access points show up once per BSSID;
+        # hidden networks have an empty SSID and can't be picked anyway
+        seen = set()
+        for result in wlan_sta.scan():
+            if result[0]:
+                seen.add(result[0].decode('utf-8'))
+        ssids = sorted(seen)
+        _scan_cache[0] = time.ticks_ms()
+        _scan_cache[1] = ssids
+    return ssids
+
+
+def handle_root(client, rescan=False):
+    try:
         send_header(client)
-        for chunk in iter_root_html(ssids):
+        # The scan (if the cache is stale) runs after the page head is sent
+        for chunk in iter_root_html(lambda: get_ssids(force=rescan)):
             client.sendall(chunk)
         client.close()
     except Exception as e:
@@ -243,19 +429,97 @@ def handle_root(client):
         else:
             raise
 
+def parse_request_line(request):
+    """Split the target of an HTTP request line into path and query.
+
+    Scans for the two spaces around the target instead of running a regex
+    over the whole request.
+
+    Args:
+        request (bytes): Raw request, starting with the request line
+
+    Returns:
+        tuple: (path, query) as bytes; path has no leading or trailing '/'
+    """
+    first = request.find(b" ")
+    second = request.find(b" ", first + 1)
+    if first < 0 or second < 0:
+        return b"", b""
+    target = request[first + 1:second]
+    query_start = target.find(b"?")
+    if query_start < 0:
+        return target.strip(b"/"), b""
+    return target[:query_start].strip(b"/"), target[query_start + 1:]
+
+
+def parse_form(request):
+    """Return the url-encoded form fields in the request body as a bytes dict."""
+    parts = request.split(b"\r\n\r\n", 1)
+    fields = {}
+    if len(parts) < 2:
+        return fields
+    for pair in parts[1].split(b"&"):
+        key_value = pair.split(b"=", 1)
+        if len(key_value) == 2:
+            fields[key_value[0]] = key_value[1]
+    return fields
+
+
+def _hex_value(c):
+    """Return the value of an ASCII hex digit byte, or -1 if it isn't one."""
+    if 0x30 <= c <= 0x39:  # 0-9
+        return c - 0x30
+    c |= 0x20  # fold to lower case
+    if 0x61 <= c <= 0x66:  # a-f
+        return c - 0x57
+    return -1
+
+
+def unquote_plus(value):
+    """Decode a url-encoded form value ('+' and %XX escapes) in one pass.
+
+    Args:
+        value (bytes): Encoded value as sent by the browser
+
+    Returns:
+        str: Decoded value
+
+    Raises:
+        UnicodeError: If the decoded bytes are not valid UTF-8
+    """
+    out = bytearray()
+    i = 0
+    n = len(value)
+    while i < n:
+        c = value[i]
+        if c == 0x2B:  # '+'
+            out.append(0x20)
+            i += 1
+            continue
+        if c == 0x25 and i + 2 < n:  # '%'
+            high = _hex_value(value[i + 1])
+            low = _hex_value(value[i + 2])
+            if high >= 0 and low >= 0:
+                out.append(high << 4 | low)
+                i += 3
+                continue
+        out.append(c)
+        i += 1
+    return out.decode("utf-8")
+
+
 def handle_configure(client, request):
-    match = ure.search("ssid=([^&]*)&password=(.*)", request)
+    fields = parse_form(request)
 
-    if match is None:
+    if b"ssid" not in fields or b"password" not in fields:
         send_response(client, "Parameters not found", status_code=400)
         return False
-    # version 1.9 compatibility
     try:
-        ssid = match.group(1).decode("utf-8").replace("%3F", "?").replace("%21", "!").replace("+"," ").replace("%26", "&")
-        password = match.group(2).decode("utf-8").replace("%3F", "?").replace("%21", "!").replace("%26", "&")
-    except Exception:
-        ssid = match.group(1).replace("%3F", "?").replace("%21", "!").replace("+"," ").replace("%26", "&")
-        password = match.group(2).replace("%3F", "?").replace("%21", "!").replace("%26", "&")
+        ssid = unquote_plus(fields[b"ssid"])
+        password = unquote_plus(fields[b"password"])
+    except UnicodeError:
+        send_response(client, "SSID and password must be valid UTF-8", status_code=400)
+        return False
 
     if len(ssid) == 0:
         send_response(client, "SSID must be provided", status_code=400)
@@ -276,14 +540,7 @@ def handle_configure(client, request):
             </html>
         """ % dict(ssid=ssid)
         send_response(client, response)
-        try:
-            profiles = read_profiles()
-        except OSError:
-            profiles = {}
-        profiles[ssid] = password
-        write_profiles(profiles)
-
-        time.sleep(5)
+        save_profile(ssid, password)
 
         return True
     else:
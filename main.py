@@ -1,8 +1,9 @@
 import machine
-from lib.program import Program
+from lib.program import Program, print_exception
+from lib.wifimgr import CaptiveNetworkTimeoutException, get_profiles
 from lib.logger import init_logger
 from lib.device_state import init_device_state
-from lib.config import LOG_CONFIG, TEST_MODE
+from lib.config import LOG_CONFIG, SLEEP_CONFIG, TEST_MODE
 from environment import (
     IOT_MANAGER_BASE_URL,
     DEVICE_ID,
@@ -32,11 +33,20 @@ def main():
     except Exception as e:
         logger.error(f"Unhandled exception in main: {e}")
         state.record_error(str(e), 'main_exception')
-        import traceback
-        traceback.print_exc()
-        # probably a WiFi issue; restart
-        logger.info("Restarting device...")
-        machine.reset()
+        print_exception(e)
+        if isinstance(e, CaptiveNetworkTimeoutException) and not get_profiles():
+            # Never configured: a reset reopens the portal, whereas a timer
+            # wake from deep sleep would not
+            logger.info("No WiFi configured, restarting captive portal")
+            state.flush(force=True)
+            logger.close()
+            machine.reset()
+        # Probably a WiFi or server issue. Sleep before retrying rather than
+        # resetting straight away, which can loop at full power.
+        logger.info(f"Entering deep sleep for {SLEEP_CONFIG['wifi_failure_sleep_ms'] / 1000 / 60:.0f} minutes")
+        state.flush(force=True)
+        logger.close()
+        machine.deepsleep(SLEEP_CONFIG['wifi_failure_sleep_ms'])
 
 if __name__ == '__main__':
     main()